@@ -6,20 +6,25 @@ import numpy as np
 import win32api, win32con, win32gui
 import ctypes.wintypes
 import threading
+import time
 import os, sys
 from screeninfo import get_monitors
 from ctypes import windll
-from queue import Queue
-
-import visualizers.soundwaves as soundwaves
-import visualizers.freq_spikes as freq_spikes
-import visualizers.blackhole as blackhole
-import visualizers.particle_field as particle_field
-#import visualizers.pitch_spikes as pitch_spikes
-#import visualizers.spirograph as spirograph
-#import visualizers.perlinfield as perlinfield
+from queue import Queue, Empty
+
+from visualizers import VISUALIZERS
+from audio_analysis import AudioAnalyzer, aggregate_features, split_features
+from feature_tracks import FeatureTrackSource
 from color_manager import ColorFade
 from config_manager import Config
+from quality_governor import QualityGovernor
+from pipeline import SimulationPipeline
+from compositor import Compositor
+from displays import DisplayRegions, bounding_box, select_monitors
+from feature_broadcast import FeaturePublisher
+from profiler import ProfileSession
+from seeding import make_rng
+from idle_monitor import IdleMonitor
 
 # TODO
     # setup new beat detection
@@ -35,41 +40,87 @@ from config_manager import Config
     # improve color fade
 
 class Visualizer:
-    def __init__(self):
+    def __init__(self, feature_source=None):
         self.color = (0,0,0)
         self.audio_queue = Queue()
-        monitor = get_monitors()[0]
-        self.SCREEN_WIDTH = monitor.width
-        self.SCREEN_HEIGHT = monitor.height
+        self.config_queue = Queue()  # (settings, changed keys) from the config watcher
+        self.feature_source = feature_source  # precomputed tracks replace the loopback capture
         self.config = Config(self)
         self.setup_display()
         self.average_volume = None
         self.done = False
         self.dt = 0
+        self.metrics = {}
+        self.pipeline = None
+        self.idle_monitor = None
+        self.publisher = None
+        self.profile_session = None
+        self.backlog = []  # chunks already taken off the queue, analysed first next frame
 
     def set_visualizer(self):
-        self.valid_visualizers = {
-            "blackhole": blackhole.BlackHole(self),
-            "soundwaves": soundwaves.Soundwaves(self),
-            "freq_spikes": freq_spikes.FreqSpikes(self),
-            "particle_field": particle_field.ParticleField(self)
-            #"pitch_spikes": pitch_spikes.PitchSpikes(self),
-            #"perlinfield": perlinfield.PerlinField(self),
-            #"spirograph": spirograph.Spirograph(self)
-        }
+        if self.multi_display:
+            # one visualizer per monitor, or one spanning them, each region with its own render target
+            self.active_visualizer = DisplayRegions(self)
+            return
+        self.active_visualizer = self.build_visualizer(self)
+
+    def build_visualizer(self, host):
+        if self.settings["layers"]:
+            # the compositor stands in for a single visualizer and runs every layer
+            return Compositor(host)
         selected_visualizer = self.settings["active_visualizer"]
-        self.active_visualizer = self.valid_visualizers[selected_visualizer]
+        return VISUALIZERS[selected_visualizer](host)
+
+    def make_rng(self, name):
+        return make_rng(self.settings["seed"], name)
+
+    def visualizer_names(self):
+        if self.settings["layers"]:
+            return [layer["visualizer"] for layer in self.settings["layers"]]
+        return [self.settings["active_visualizer"]]
+
+    def setup_monitors(self):
+        # the window covers the bounding box of the selected monitors, monitor_rects are in window coordinates
+        monitors = select_monitors(get_monitors(), self.settings["display"]["monitors"])
+        box = bounding_box(monitors)
+        self.window_position = box.topleft
+        self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT = box.size
+        self.monitor_rects = [pygame.Rect(m.x - box.x, m.y - box.y, m.width, m.height) for m in monitors]
+        self.multi_display = len(self.monitor_rects) > 1
 
     def setup_display(self):
         pygame.init()
-        os.environ['SDL_VIDEO_WINDOW_POS'] = "%d,%d" % (0, 0)
-        self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT),pygame.NOFRAME)
+        self.setup_monitors()
+        os.environ['SDL_VIDEO_WINDOW_POS'] = "%d,%d" % self.window_position
+        self.display = pygame.display.set_mode((self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT),pygame.NOFRAME)
         self.hwnd = pygame.display.get_wm_info()['window']
         self.keep_topmost()
         self.set_window_transparency()
+        # with several monitors only their regions are ever presented, so the gaps between them stay transparent from here
+        self.display.fill(self.fuchsia)
+        pygame.display.flip()
+        self.dirty_rects = []
         pygame.display.set_caption('Desktop Audio Visualizer')
         self.clock = pygame.time.Clock()
         self.fps = 60
+        self.governor = QualityGovernor(self.fps)
+        self.setup_render_target()
+
+    def setup_render_target(self):
+        # Visualizers draw into self.screen at SCREEN_WIDTH x SCREEN_HEIGHT.
+        # Below full scale that is an offscreen surface upscaled once per frame in send_frame()
+        self.render_scale = self.settings["render_scale"]
+        if self.multi_display:
+            # every display region scales into its own part of the window, see displays.py
+            self.SCREEN_WIDTH, self.SCREEN_HEIGHT = self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT
+            self.screen = self.display
+            return
+        self.SCREEN_WIDTH = max(1, round(self.DISPLAY_WIDTH * self.render_scale))
+        self.SCREEN_HEIGHT = max(1, round(self.DISPLAY_HEIGHT * self.render_scale))
+        if (self.SCREEN_WIDTH, self.SCREEN_HEIGHT) == (self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT):
+            self.screen = self.display
+        else:
+            self.screen = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT), 0, self.display)
 
     # FIXED with https://stackoverflow.com/questions/74589479/making-window-topmost-with-python-and-or-windows-api
     # Note: Cannot overlay fullscreen applications
@@ -92,18 +143,26 @@ class Visualizer:
                                             win32api.RGB(*self.fuchsia), 0,
                                             win32con.LWA_COLORKEY)
 
-    def setup_audio(self):
+    def setup_audio(self, device):
         self.RATE = 48000
         self.CHUNK = 2048
         self.FORMAT = pyaudio.paFloat32
-        self.CHANNELS = 1
+        # multichannel captures the device's native layout, read at startup only
+        self.CHANNELS = device["maxInputChannels"] if self.settings["multichannel"] else 1
         self.setup_pitch_detection()
         self.set_visualizer()
 
     def setup_pitch_detection(self):
-        self.pDetection = aubio.pitch("schmitt", 8192, self.CHUNK, self.RATE)
-        self.pDetection.set_unit("Hz")
-        self.pDetection.set_silence(-40)
+        self.analyzer = AudioAnalyzer(self.RATE, self.CHUNK, self.CHANNELS)
+        # fed to the visualizer while idle, so it can decay to rest without any DSP
+        self.silence = self.analyzer.process(np.zeros(self.CHUNK * self.CHANNELS, dtype=aubio.float_type))
+
+    def setup_replay(self):
+        self.RATE = self.feature_source.rate
+        self.CHUNK = self.feature_source.chunk
+        self.replay_start = time.perf_counter()
+        self.replay_hop = -1
+        self.set_visualizer()
 
     def get_loopback_device(self, p):
         # Get default WASAPI speakers
@@ -120,9 +179,13 @@ class Visualizer:
         return default_speakers
 
     def start(self):
+        if self.feature_source is not None:
+            self.setup_replay()
+            self.main()
+            return
         with pyaudio.PyAudio() as p:
             default_speakers = self.get_loopback_device(p)
-            self.setup_audio()
+            self.setup_audio(default_speakers)
             with p.open(format=self.FORMAT, 
                         channels=self.CHANNELS,
                         rate=self.RATE,
@@ -133,7 +196,13 @@ class Visualizer:
                 self.main()
 
     def stop(self):
-        self.audio_thread.join()
+        if self.feature_source is None:
+            self.audio_thread.join()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.publisher is not None:
+            self.publisher.close()
+        self.finish_profiling()
         self.config.stop_observer()
 
     def check_user_input(self):
@@ -143,31 +212,226 @@ class Visualizer:
                 self.done = True
 
     def update(self):
-        # read in audio and calculate signal properties
-        #print(self.audio_queue.qsize())
-        if not self.audio_queue.empty():
-            frame = self.audio_queue.get()
-            samples = np.frombuffer(frame, dtype=aubio.float_type)
-            audio_features = self.process_audio(samples)
+        self.simulate(self.read_features())
+
+    def simulate(self, features):
+        if self.pipeline is not None:
+            # simulates the next frame on the worker while this one is drawn
+            self.pipeline.step(features)
+            return
+        for audio_features in features:
             self.active_visualizer.update(audio_features)
 
+    def read_features(self):
+        # the feature dicts to feed the visualizer this frame, possibly none
+        if self.feature_source is not None:
+            features = chunks = self.read_tracks()
+        else:
+            features, chunks = self.read_audio_features()
+        if self.publisher is not None:
+            # external consumers get every chunk, even when the visualizer only sees the aggregate
+            for audio_features in chunks:
+                self.publisher.publish(audio_features)
+        if self.idle_enabled:
+            # loopback capture can deliver nothing at all during silence, which counts as silent too
+            volume = max(float(audio_features["volume"]) for audio_features in features) if features else 0.0
+            self.idle_monitor.record(volume, time.perf_counter())
+        return features
+
+    def read_audio_features(self):
+        # read in audio and calculate signal properties, as (features for the visualizer, features per chunk)
+        #print(self.audio_queue.qsize())
+        frames, self.backlog = self.backlog, []
+        while not self.audio_queue.empty():
+            frames.append(self.audio_queue.get())
+        if len(frames) == 1:
+            samples = np.frombuffer(frames[0], dtype=aubio.float_type)
+            features = [self.process_audio(samples)]
+            return features, features
+        if not frames:
+            return [], []
+        # a backlog is caught up with one vectorized call instead of one per chunk
+        batch = self.process_audio_batch(frames)
+        chunks = split_features(batch)
+        if getattr(self.active_visualizer, "consumes_sequence", False):
+            return chunks, chunks
+        return [aggregate_features(batch)], chunks
+
+    def read_tracks(self):
+        # replay the precomputed features in real time, looping at the end of the track
+        elapsed = time.perf_counter() - self.replay_start
+        hop = self.feature_source.hop_at(elapsed) % len(self.feature_source)
+        if hop == self.replay_hop:
+            return []
+        self.replay_hop = hop
+        return [self.feature_source[hop]]
+
     def draw(self):
         if self.color_scheme == "fade":
             self.color = self.colorfade.next()
+        if self.multi_display:
+            # regions fill their own monitors and skip themselves when nothing changed
+            self.dirty_rects = self.active_visualizer.draw()
+            return
         self.screen.fill(self.fuchsia)
         self.active_visualizer.draw()
 
-    def send_frame(self):
+    def present(self):
+        if self.multi_display:
+            pygame.display.update(self.dirty_rects)
+            return
+        if self.screen is not self.display:
+            # transform.scale is nearest-neighbour, so colour-keyed pixels stay exactly fuchsia
+            pygame.transform.scale(self.screen, (self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT), self.display)
         pygame.display.flip()
+
+    def send_frame(self):
+        self.present()
         self.dt = self.clock.tick(self.fps) / 1000.0
         #print(int(self.clock.get_fps()))
+        self.update_metrics()
+
+    def update_metrics(self):
+        # get_rawtime excludes the tick delay, so it's the real cost of the frame
+        frame_time = self.clock.get_rawtime()
+        if self.adaptive_quality and self.governor.record(frame_time) and self.has_quality_levels():
+            self.sync_simulation()
+            self.active_visualizer.set_quality(self.governor.level)
+        self.metrics["fps"] = self.clock.get_fps()
+        self.metrics["frame_ms"] = frame_time
+        self.metrics["quality_level"] = self.governor.level
+        if self.publisher is not None:
+            self.metrics["broadcast_sent"] = self.publisher.sent
+            self.metrics["broadcast_dropped"] = self.publisher.dropped
+        self.update_idle_metrics()
+
+    def update_idle_metrics(self):
+        now = time.perf_counter()
+        self.metrics["idle"] = self.idle_monitor.idle
+        self.metrics["idle_wakeups"] = self.idle_monitor.wakeups
+        self.metrics["idle_seconds"] = self.idle_monitor.total_idle_seconds(now)
+        self.metrics["idle_cpu_seconds"] = self.idle_monitor.idle_cpu_seconds
+
+    def has_quality_levels(self):
+        return bool(getattr(self.active_visualizer, "quality_levels", None))
+
+    def apply_quality(self):
+        # level 0 is the configured quality, each level above it is cheaper
+        levels = getattr(self.active_visualizer, "quality_levels", None)
+        if not levels:
+            # nothing to scale, so don't keep the previous visualizer's ladder around
+            self.governor.level = 0
+            self.governor.reset(0)
+            return
+        if not self.adaptive_quality:
+            self.governor.level = 0
+        self.governor.reset(len(levels) - 1)
+        self.active_visualizer.set_quality(self.governor.level)
+
+    def setup_pipeline(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+        # visualizers opt in by publishing their render state, the rest keep simulating on this thread
+        if self.settings["pipelined"] and hasattr(self.active_visualizer, "publish_state"):
+            self.pipeline = SimulationPipeline(self.active_visualizer)
+
+    def sync_simulation(self):
+        # the main thread may only touch the visualizer while no simulation step is running
+        if self.pipeline is not None:
+            self.pipeline.wait()
+
+    def setup_idle(self):
+        # idle mode watches the live capture, replays always run at full rate
+        settings = self.settings["idle"]
+        self.idle_enabled = settings["enabled"] and self.feature_source is None
+        self.idle_fps = settings["fps"]
+        if self.idle_monitor is None:
+            self.idle_monitor = IdleMonitor(settings["after_seconds"])
+            self.idle_next_tick = 0
+        self.idle_monitor.after_seconds = settings["after_seconds"]
+        if self.idle_monitor.idle and not self.idle_enabled:
+            self.wake()
+
+    def setup_broadcast(self):
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+        settings = self.settings["broadcast"]
+        if settings["enabled"]:
+            self.publisher = FeaturePublisher(settings["port"], settings["bars"])
+
+    def setup_profiling(self):
+        # any change to the section ends the running window, enabled starts a fresh one
+        self.finish_profiling()
+        settings = self.settings["profiling"]
+        if settings["enabled"]:
+            label = "+".join(self.visualizer_names())
+            self.profile_session = ProfileSession(settings["mode"], settings["duration"], settings["interval_ms"], label)
+            self.profile_session.start()
+
+    def finish_profiling(self):
+        if self.profile_session is not None:
+            path = self.profile_session.stop()
+            self.profile_session = None
+            # pythonw has no console, and a message box on its own thread doesn't stall the render loop
+            message = f"Profile written to {os.path.abspath(path)}"
+            # daemon, so quitting with the box still open doesn't leave a windowless process behind
+            threading.Thread(target=windll.user32.MessageBoxW, name="profile report", daemon=True,
+                             args=(0, message, u"Profiling", win32con.MB_ICONINFORMATION)).start()
+
+    def wake(self):
+        self.idle_monitor.wake(time.perf_counter())
+        self.clock.tick()  # so the first active frame's dt doesn't span the idle stretch
+
+    def visualizer_settled(self):
+        # visualizers without is_settled() keep presenting at the idle rate
+        self.sync_simulation()
+        is_settled = getattr(self.active_visualizer, "is_settled", None)
+        return is_settled is not None and is_settled()
+
+    def idle_step(self):
+        # Only each chunk's RMS is computed while idle. Blocking on the queue instead of
+        # sleeping means sound wakes the loop within one chunk.
+        cpu_start = time.process_time()
+        try:
+            frame = self.audio_queue.get(timeout=max(0.0, self.idle_next_tick - time.perf_counter()))
+        except Empty:
+            frame = None
+        while frame is not None:
+            samples = np.frombuffer(frame, dtype=aubio.float_type)
+            rms = np.linalg.norm(samples) / np.sqrt(len(samples))
+            if self.idle_monitor.record(rms, time.perf_counter()):
+                # sound is back, this chunk gets the full analysis next frame
+                self.backlog.append(frame)
+                self.clock.tick()
+                break
+            frame = None if self.audio_queue.empty() else self.audio_queue.get()
+
+        now = time.perf_counter()
+        if self.idle_monitor.idle and now >= self.idle_next_tick:
+            self.idle_next_tick = now + 1 / self.idle_fps
+            # step on silence at the idle rate until the visualizer comes to rest, then stop presenting
+            if not self.visualizer_settled():
+                self.simulate([self.silence])
+                self.draw()
+                self.present()
+        self.idle_monitor.idle_cpu_seconds += time.process_time() - cpu_start
+        self.update_idle_metrics()
 
     def main(self):
         self.process_config_change()
-        self.audio_thread = threading.Thread(target=self.read_audio)
-        self.audio_thread.start()
+        if self.feature_source is None:
+            self.audio_thread = threading.Thread(target=self.read_audio, name="audio")
+            self.audio_thread.start()
         while not self.done:
             self.check_user_input()            
+            self.apply_config_changes()
+            if self.profile_session is not None and self.profile_session.expired():
+                self.finish_profiling()
+            if self.idle_monitor.idle:
+                self.idle_step()
+                continue
             self.update()
             self.draw()
             self.send_frame()
@@ -181,21 +445,12 @@ class Visualizer:
             self.done = True
 
     def process_audio(self, samples):
-        pitch = self.pDetection(samples)[0]
-        rms_volume = np.linalg.norm(samples) / np.sqrt(len(samples))
         #normalized_volume = self.normalize_volume(rms_volume)
-        windowed_data = samples * self.hann_window(self.CHUNK)
-        fft = np.fft.fft(windowed_data)
-        amps = np.abs(fft) #/ 6
-        return {
-                "fft": fft,
-                "amps": amps,
-                "pitch": pitch,
-                "volume": rms_volume
-        }
-
-    def hann_window(self, length):
-        return 0.5 * (1 - np.cos(2 * np.pi * np.arange(length) / (length - 1)))
+        return self.analyzer.process(samples)
+
+    def process_audio_batch(self, frames):
+        chunks = np.frombuffer(b"".join(frames), dtype=aubio.float_type).reshape(len(frames), -1)
+        return self.analyzer.process_batch(chunks)
 
     def normalize_volume(self, current_volume, alpha=0.5):
         if self.average_volume is None:
@@ -208,17 +463,58 @@ class Visualizer:
         normalized_volume = current_volume / self.average_volume if self.average_volume else 1
         return normalized_volume
 
-    def process_config_change(self):
+    def apply_config_changes(self):
+        # reloads are queued by the watcher thread and applied here, between frames
+        while not self.config_queue.empty():
+            self.sync_simulation()
+            self.settings, changes = self.config_queue.get()
+            self.process_config_change(changes)
+
+    def process_config_change(self, changes=None):
+        # changes is the set of changed keys from a reload, None applies everything
+        def changed(*keys):
+            return changes is None or any(change == key or change.startswith(key + ".") for change in changes for key in keys)
+
+        reload = changes is not None
         self.sensitivity = self.settings["volume_sensitivity"]
+        self.adaptive_quality = self.settings["adaptive_quality"]
         self.color_scheme = self.settings["color_scheme"]
-        self.color = self.settings["static_color"]
-        fade_cycle = self.settings["fade_cycle"]
-        fade_speed = self.settings["fade_speed"]
-        self.colorfade = ColorFade(fade_cycle, fade_speed)
-        self.active_visualizer.update_settings()
+        if changed("color_scheme", "static_color"):
+            self.color = self.settings["static_color"]
+        if changed("fade_cycle"):
+            self.colorfade = ColorFade(self.settings["fade_cycle"], self.settings["fade_speed"])
+        elif changed("fade_speed"):
+            self.colorfade.speed = self.settings["fade_speed"]
+        if reload and changed("keep_topmost"):
+            self.keep_topmost()
+        if reload and changed("display"):
+            # a new window at the new position and size, the visualizer is rebuilt for it below
+            pygame.display.quit()
+            self.setup_display()
+        elif reload and changed("render_scale"):
+            self.setup_render_target()
+        if changed("idle"):
+            self.setup_idle()
+        if changed("broadcast"):
+            self.setup_broadcast()
+        if changed("profiling"):
+            self.setup_profiling()
+
+        # only rebuild the visualizer when its own settings or the render size changed
+        rebuild = reload and changed("render_scale", "display", "active_visualizer", "layers", "seed", *self.visualizer_names())
+        if rebuild:
+            self.set_visualizer()
+        if rebuild or changed("volume_sensitivity"):
+            self.active_visualizer.update_settings()
+        if rebuild or changed("volume_sensitivity", "adaptive_quality"):
+            self.apply_quality()
+        if rebuild or changed("pipelined"):
+            self.setup_pipeline()
 
 
 if __name__ == "__main__":
-    visualizer = Visualizer()
+    # optional argument: a feature track directory from feature_tracks.py to replay instead of live audio
+    feature_source = FeatureTrackSource(sys.argv[1]) if len(sys.argv) > 1 else None
+    visualizer = Visualizer(feature_source)
     visualizer.start()
     visualizer.stop()
\ No newline at end of file
@@ -0,0 +1,159 @@
+import os
+import wave
+import aubio  # audio feature extraction
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+PITCH_BUFFER = 8192
+
+class AudioAnalyzer:
+    def __init__(self, rate, chunk, channels=1):
+        self.rate = rate
+        self.chunk = chunk
+        self.channels = channels  # above 1, samples arrive interleaved
+        self.window = hann_window(chunk)
+        self.pDetection = aubio.pitch("schmitt", PITCH_BUFFER, chunk, rate)
+        self.pDetection.set_unit("Hz")
+        self.pDetection.set_silence(-40)
+
+    def process(self, samples):
+        if self.channels > 1:
+            return split_features(self.process_batch(samples[np.newaxis]))[0]
+        pitch = self.pDetection(samples)[0]
+        rms_volume = np.linalg.norm(samples) / np.sqrt(len(samples))
+        peak = np.max(np.abs(samples))
+        windowed_data = samples * self.window
+        # the input is real, so the one-sided spectrum holds everything the full fft did
+        fft = np.fft.rfft(windowed_data)
+        amps = np.abs(fft) #/ 6
+        return {
+                "fft": fft,
+                "amps": amps,
+                "pitch": pitch,
+                "volume": rms_volume,
+                "peak": peak
+        }
+
+    def process_batch(self, frames):
+        """The process() features for a 2D array of consecutive chunks, one row per chunk."""
+        if self.channels > 1:
+            return self.process_channels(self.deinterleave(frames))
+        # pitch tracking is stateful, so it still walks the rows in order
+        pitch = np.array([self.pDetection(row)[0] for row in frames])
+        rms_volume = np.linalg.norm(frames, axis=1) / np.sqrt(frames.shape[1])
+        peak = np.max(np.abs(frames), axis=1)
+        fft = np.fft.rfft(frames * self.window, axis=1)
+        amps = np.abs(fft)
+        return {
+                "fft": fft,
+                "amps": amps,
+                "pitch": pitch,
+                "volume": rms_volume,
+                "peak": peak
+        }
+
+    def deinterleave(self, frames):
+        """(n, chunk * channels) interleaved rows as a (n, channels, chunk) strided view, no copy."""
+        return frames.reshape(len(frames), self.chunk, self.channels).transpose(0, 2, 1)
+
+    def process_channels(self, channels):
+        """
+        Features for (n, channels, chunk) audio. The mono features come from
+        the mid (mean) signal, and per-channel plus side spectra are added.
+        """
+        mono = channels.mean(axis=1)
+        pitch = np.array([self.pDetection(row)[0] for row in mono])
+        # one rfft call covers every chunk of every channel
+        spectra = np.fft.rfft(channels * self.window, axis=-1)
+        # mid and side are linear in the signal, so their spectra need no extra FFTs
+        mid = spectra.mean(axis=1)
+        side = (spectra[:, 0] - spectra[:, 1]) / 2
+        return {
+                "fft": mid,
+                "amps": np.abs(mid),
+                "pitch": pitch,
+                "volume": np.linalg.norm(mono, axis=1) / np.sqrt(self.chunk),
+                "peak": np.max(np.abs(channels), axis=(1, 2)),
+                "channel_amps": np.abs(spectra),
+                "channel_volume": np.linalg.norm(channels, axis=-1) / np.sqrt(self.chunk),
+                "side_amps": np.abs(side)
+        }
+
+
+def aggregate_features(batch):
+    """
+    Collapses a process_batch() result into a single feature dict: the
+    latest fft and pitch, and a max-hold of everything else (spectra, volume, peak).
+    """
+    latest = ("fft", "pitch")
+    return {name: values[-1] if name in latest else np.max(values, axis=0) for name, values in batch.items()}
+
+def split_features(batch):
+    """A process_batch() result as the per-chunk feature dicts, in order. Each entry is a view into the batch."""
+    return [{name: values[i] for name, values in batch.items()} for i in range(len(batch["volume"]))]
+
+def hann_window(length):
+    return 0.5 * (1 - np.cos(2 * np.pi * np.arange(length) / (length - 1)))
+
+def load_wav(path):
+    """Reads a PCM wav file and returns (mono float samples in [-1, 1], sample rate)."""
+    with wave.open(path, "rb") as f:
+        rate = f.getframerate()
+        channels = f.getnchannels()
+        width = f.getsampwidth()
+        data = f.readframes(f.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 2**15
+    elif width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 2**23
+    elif width == 4:
+        samples = np.frombuffer(data, dtype=np.int32).astype(np.float32) / 2**31
+    else:
+        raise ValueError(f"Unsupported sample width: {width} bytes")
+
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples.astype(aubio.float_type), rate
+
+def analyze_segment(segment, rate, chunk, skip):
+    """
+    Runs the features for every chunk of `segment`, dropping the first
+    `skip` results. Those leading chunks only exist to warm up the pitch
+    detector so its output matches a sequential run over the whole file.
+    """
+    analyzer = AudioAnalyzer(rate, chunk)
+    features = []
+    for hop in range(len(segment) // chunk):
+        result = analyzer.process(segment[hop * chunk:(hop + 1) * chunk])
+        if hop >= skip:
+            features.append(result)
+    return features
+
+def analyze_parallel(samples, rate, chunk, workers=None):
+    """
+    Computes the feature dict for every chunk of `samples` ahead of time
+    across a process pool. Features never depend on simulation state, so
+    the file can be split into independent segments.
+    """
+    n_hops = len(samples) // chunk
+    warmup = PITCH_BUFFER // chunk + 1
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # a few segments per worker keeps the pool busy when segments finish unevenly
+        n_segments = max(1, min(n_hops, workers * 4))
+        bounds = np.linspace(0, n_hops, n_segments + 1).astype(int)
+        jobs = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            first = max(0, start - warmup)
+            segment = samples[first * chunk:stop * chunk]
+            jobs.append(pool.submit(analyze_segment, segment, rate, chunk, start - first))
+
+        features = []
+        for job in jobs:
+            features.extend(job.result())
+    return features
@@ -0,0 +1,48 @@
+import json
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+# keeps pygame's import banner out of the benchmark output
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+import numpy as np
+import pygame
+
+from audio_analysis import AudioAnalyzer, split_features
+from render_offline import OfflineHost
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RATE = 48000
+CHUNK = 2048
+
+def load_settings(active_visualizer=None, **sections):
+    """config.json from the repo root, with the active visualizer and any settings sections overridden."""
+    with open(os.path.join(REPO_DIR, "config.json"), "r") as f:
+        settings = json.load(f)
+    if active_visualizer is not None:
+        settings["active_visualizer"] = active_visualizer
+    for section, values in sections.items():
+        if isinstance(values, dict):
+            settings[section].update(values)
+        else:
+            settings[section] = values
+    return settings
+
+def make_host(settings, width=1920, height=1080):
+    if not pygame.display.get_init():
+        pygame.display.init()
+        pygame.display.set_mode((1, 1))
+    return OfflineHost(settings, width, height, RATE, CHUNK)
+
+def synthetic_audio(n_samples, rate=RATE, seed=0):
+    """`n_samples` of a deterministic test signal: a swept tone with a pulsing bass note and a little noise."""
+    rng = np.random.default_rng(seed)
+    seconds = n_samples / rate
+    t = np.arange(n_samples) / rate
+    sweep = np.sin(2 * np.pi * (200 + 1800 * t / seconds) * t)
+    bass = np.sin(2 * np.pi * 55 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 2 * t))
+    noise = rng.normal(0, 0.05, len(t))
+    return (0.3 * sweep + 0.4 * bass + noise).astype(np.float32)
+
+def synthetic_features(n_chunks, rate=RATE, chunk=CHUNK, seed=0):
+    frames = synthetic_audio(n_chunks * chunk, rate, seed).reshape(n_chunks, chunk)
+    return split_features(AudioAnalyzer(rate, chunk).process_batch(frames))
@@ -0,0 +1,133 @@
+"""
+Golden-frame checks: renders every visualizer from fixed synthetic audio
+with a fixed seed and compares the frames against stored goldens, so an
+optimization can be shown not to change the output.
+
+    python -m benchmarks.golden --update        # record goldens from the current code
+    python -m benchmarks.golden                 # check against them, with timing
+    python -m benchmarks.golden --visualizer particle_field --tolerance 0.02
+
+Every frame's hash is stored, and so is every KEYFRAME_EVERY-th frame as an
+image. Frames whose hash matches are exact. A run passes if every keyframe
+that doesn't match has at most --tolerance of its pixels more than
+PIXEL_DELTA off in any channel, which allows for float rounding in a
+vectorized rewrite. Goldens depend on the machine and the
+library versions, so they are git-ignored like the microbench baseline.
+
+Recording refuses a visualizer whose frames all hash the same, since a
+golden of a blank or frozen render would pass against anything that also
+draws nothing. The default size is full HD because several visualizers
+have geometry tuned in display pixels and draw little or nothing at
+small sizes.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# first, so its environment (dummy video driver, no pygame banner) is set before pygame loads
+from benchmarks.common import load_settings, make_host, synthetic_features
+import pygame
+from render_offline import render
+from visualizers import VISUALIZERS
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "goldens")
+SEED = 1234
+FPS = 60
+KEYFRAME_EVERY = 30
+PIXEL_DELTA = 8
+
+def render_frames(name, n_frames, width, height):
+    """(hashes, keyframes, ms per frame) for `n_frames` of a visualizer."""
+    settings = load_settings(name, seed=SEED, color_scheme="fade")
+    host = make_host(settings, width, height)
+    n_chunks = int(n_frames / FPS * host.RATE / host.CHUNK) + 1
+    features = synthetic_features(n_chunks)
+
+    hashes = []
+    keyframes = {}
+    def write_frame(frame, surface):
+        if frame >= n_frames:
+            return
+        pixels = pygame.surfarray.array3d(surface)
+        hashes.append(hashlib.sha1(pixels.tobytes()).hexdigest())
+        if frame % KEYFRAME_EVERY == 0:
+            keyframes[str(frame)] = pixels
+
+    start = time.perf_counter()
+    render(features, host, FPS, write_frame)
+    elapsed = time.perf_counter() - start
+    return hashes[:n_frames], keyframes, elapsed / max(len(hashes), 1) * 1000
+
+def golden_paths(name):
+    return os.path.join(GOLDEN_DIR, f"{name}.json"), os.path.join(GOLDEN_DIR, f"{name}.npz")
+
+def save(name, hashes, keyframes, size):
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    hash_path, keyframe_path = golden_paths(name)
+    with open(hash_path, "w") as f:
+        json.dump({"seed": SEED, "fps": FPS, "size": size, "hashes": hashes}, f, indent=4)
+    np.savez_compressed(keyframe_path, **keyframes)
+
+def differing_fraction(a, b):
+    return np.mean(np.any(np.abs(a.astype(np.int16) - b.astype(np.int16)) > PIXEL_DELTA, axis=-1))
+
+def check(name, hashes, keyframes, size, tolerance):
+    """Compares the frames with the goldens, returning (passed, summary)."""
+    hash_path, keyframe_path = golden_paths(name)
+    if not os.path.exists(hash_path):
+        return False, "no goldens, record them with --update"
+    with open(hash_path, "r") as f:
+        golden = json.load(f)
+    if golden["size"] != size or golden["seed"] != SEED:
+        return False, f"goldens were recorded at {golden['size']} with seed {golden['seed']}, re-record them"
+
+    n = min(len(hashes), len(golden["hashes"]))
+    exact = sum(a == b for a, b in zip(hashes[:n], golden["hashes"][:n]))
+    worst = 0.0
+    with np.load(keyframe_path) as golden_keyframes:
+        for frame, pixels in keyframes.items():
+            if frame in golden_keyframes and hashes[int(frame)] != golden["hashes"][int(frame)]:
+                worst = max(worst, differing_fraction(pixels, golden_keyframes[frame]))
+    passed = worst <= tolerance and len(hashes) == len(golden["hashes"])
+    return passed, f"{exact:>5}/{n} frames exact, worst keyframe {worst:7.3%} of pixels off  {'ok' if passed else 'FAIL'}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Check rendered frames against stored goldens.")
+    parser.add_argument("--update", action="store_true", help="record the goldens from the current code")
+    parser.add_argument("--frames", type=int, default=240)
+    parser.add_argument("--size", default="1920x1080", help="render size (default: 1920x1080)")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="fraction of pixels a keyframe may have off (default: 0.01)")
+    parser.add_argument("--visualizer", action="append", choices=list(VISUALIZERS), help="only these (default: all)")
+    args = parser.parse_args()
+
+    width, height = (int(x) for x in args.size.lower().split("x"))
+    failed = []
+    for name in args.visualizer or VISUALIZERS:
+        hashes, keyframes, frame_ms = render_frames(name, args.frames, width, height)
+        if args.update:
+            distinct = len(set(hashes))
+            if distinct <= 1:
+                # nothing moved, so these goldens couldn't catch a regression
+                failed.append(name)
+                print(f"{name:<16} not recorded, all {len(hashes)} frames are identical at {args.size}")
+                continue
+            save(name, hashes, keyframes, args.size)
+            print(f"{name:<16} recorded {len(hashes)} frames ({distinct} distinct)  {frame_ms:7.3f} ms/frame")
+            continue
+        passed, summary = check(name, hashes, keyframes, args.size, args.tolerance)
+        if not passed:
+            failed.append(name)
+        print(f"{name:<16} {summary}  {frame_ms:7.3f} ms/frame")
+    if failed:
+        problem = "no distinct frames" if args.update else "out of tolerance"
+        print(f"\n{problem}: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
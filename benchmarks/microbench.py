@@ -0,0 +1,198 @@
+"""
+Microbenchmarks for the hot kernels, each at several sizes.
+
+    python -m benchmarks.microbench                     # print timings
+    python -m benchmarks.microbench --save              # store them as the baseline
+    python -m benchmarks.microbench --compare           # flag regressions against the baseline
+    python -m benchmarks.microbench --compare --threshold 0.2 --filter particle
+
+Every case reports the median over several repeats of a timed loop, so a
+single scheduler hiccup doesn't move the result. Baselines are machine
+specific, which is why microbench_baseline.json is not checked in.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+import numpy as np
+
+from audio_analysis import AudioAnalyzer
+from benchmarks.common import CHUNK, RATE, load_settings, make_host, synthetic_audio, synthetic_features
+from color_manager import ColorFade
+from visualizers.blackhole import ParticleSystem, translate_points_away_from_disk
+from visualizers.trails import TrailBuffer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microbench_baseline.json")
+REPEATS = 7
+WIDTH, HEIGHT = 1920, 1080
+
+def bench_process_audio(chunk):
+    analyzer = AudioAnalyzer(RATE, chunk)
+    samples = synthetic_audio(chunk)
+    return lambda: analyzer.process(samples)
+
+def make_freq_spikes(bins):
+    return make_host(load_settings("freq_spikes", freq_spikes={"bins": bins})).active_visualizer
+
+def bench_scale_bins(bins):
+    spikes = make_freq_spikes(bins)
+    amps = synthetic_features(1)[0]["amps"]
+    return lambda: spikes.scale_bins(amps)
+
+def bench_calculate_heights(bins):
+    spikes = make_freq_spikes(bins)
+    log_freqs, log_amplitudes = spikes.scale_bins(synthetic_features(1)[0]["amps"])
+    return lambda: spikes.calculate_heights(log_freqs, log_amplitudes)
+
+def make_particle_field(grid_size):
+    settings = load_settings("particle_field", particle_field={"grid_size": grid_size, "radial_waves": False})
+    return make_host(settings).active_visualizer
+
+def bench_internal_forces(grid_size):
+    field = make_particle_field(grid_size)
+    return field.process_internal_forces
+
+def bench_radial_wavefronts(grid_size):
+    field = make_particle_field(grid_size)
+    audio_features = synthetic_features(1)[0]
+    # a fixed set of wavefronts at spread-out radii, restored before every call so the work never changes
+    wavefronts = []
+    for radius in (0, 200, 400, 600):
+        field.generate_radial_wavefront(*field.force_center, 10.0)
+        field.persistent_radial_wavefronts[-1]["radius"] = radius
+        wavefronts.append(dict(field.persistent_radial_wavefronts[-1]))
+    def run():
+        field.persistent_radial_wavefronts = [dict(wavefront) for wavefront in wavefronts]
+        field.update_radial_wavefronts(audio_features["fft"], 10.0)
+    return run
+
+def random_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform((-200, -200, -500), (WIDTH + 200, HEIGHT + 200, 500), (n, 3))
+
+def bench_rotate_points(n):
+    host = make_host(load_settings("blackhole"), WIDTH, HEIGHT)
+    system = ParticleSystem(host, random_points(n))
+    center = (WIDTH // 2, HEIGHT // 2, 0)
+    disk_normal = np.array([0.0, 1.0, 0.0])
+    return lambda: system.rotate_points_around_axis(0.01, [0.1, 1.0, 0.0], center, disk_normal)
+
+def bench_translate_points(n):
+    points = random_points(n)
+    disk_normal = np.array([0.0, 1.0, 0.0])
+    center = (WIDTH // 2, HEIGHT // 2, 0)
+    return lambda: translate_points_away_from_disk(points, disk_normal, center, translation_speed=30)
+
+def bench_remove_offscreen(n):
+    host = make_host(load_settings("blackhole"), WIDTH, HEIGHT)
+    system = ParticleSystem(host)
+    points = random_points(n)
+    return lambda: system.remove_offscreen_particles(points, WIDTH, HEIGHT)
+
+def bench_precompute_colors(steps):
+    fade = ColorFade("rainbow")
+    fade.steps = steps
+    targets = [(255, 0, 0), (255, 255, 0), (0, 255, 0), (0, 255, 255), (0, 0, 255), (255, 0, 255)]
+    return lambda: fade.precompute_colors(targets)
+
+def bench_trail_fade(height):
+    host = make_host(load_settings("spirograph"), height * 16 // 9, height)
+    trail = TrailBuffer(host, 0.94)
+    def run():
+        trail.mark_drawn()  # keeps it from skipping the fade once clear
+        trail.fade()
+    return run
+
+# name -> (setup(size) returning the callable to time, sizes)
+CASES = {
+    "process_audio": (bench_process_audio, (1024, CHUNK, 4096)),
+    "FreqSpikes.scale_bins": (bench_scale_bins, (60, 120, 400)),
+    "FreqSpikes.calculate_heights": (bench_calculate_heights, (60, 120, 400)),
+    "ParticleField.process_internal_forces": (bench_internal_forces, (1, 2, 3, 4)),
+    "ParticleField.update_radial_wavefronts": (bench_radial_wavefronts, (1, 2, 3, 4)),
+    "ParticleSystem.rotate_points_around_axis": (bench_rotate_points, (1000, 3000, 8000)),
+    "translate_points_away_from_disk": (bench_translate_points, (1000, 3000, 8000)),
+    "ParticleSystem.remove_offscreen_particles": (bench_remove_offscreen, (1000, 3000, 8000)),
+    "ColorFade.precompute_colors": (bench_precompute_colors, (100, 300, 1000)),
+    "TrailBuffer.fade": (bench_trail_fade, (540, 1080))
+}
+
+def time_call(fn, repeats=REPEATS):
+    """Median seconds per call."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()  # enough calls per repeat to take at least 0.2 s
+    return statistics.median(timer.repeat(repeat=repeats, number=number)) / number
+
+def run(name_filter=None):
+    results = {}
+    for name, (setup, sizes) in CASES.items():
+        if name_filter and name_filter.lower() not in name.lower():
+            continue
+        for size in sizes:
+            key = f"{name}[{size}]"
+            results[key] = time_call(setup(size)) * 1e6
+            print(f"{key:<50} {results[key]:>12.2f} us", flush=True)
+    return results
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor()}
+
+def save(results, path):
+    # a filtered run only replaces the kernels it timed
+    merged = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            merged = json.load(f)["results_us"]
+    merged.update(results)
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results_us": merged}, f, indent=4)
+    print(f"baseline saved to {path}")
+
+def compare(results, path, threshold):
+    """Prints each kernel against the baseline and returns the keys that got slower by more than `threshold`."""
+    with open(path, "r") as f:
+        baseline = json.load(f)
+    if baseline["environment"] != environment():
+        print(f"warning: baseline was recorded on {baseline['environment']}", file=sys.stderr)
+
+    regressions = []
+    print(f"\n{'kernel':<50} {'baseline':>10} {'now':>10} {'change':>8}")
+    for key, now in results.items():
+        before = baseline["results_us"].get(key)
+        if before is None:
+            print(f"{key:<50} {'-':>10} {now:>10.2f}      new")
+            continue
+        change = now / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<50} {before:>10.2f} {now:>10.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the hot kernels at several sizes.")
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="compare the results against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="slowdown that counts as a regression (default: 0.15 = 15%%)")
+    parser.add_argument("--filter", default=None, help="only run kernels whose name contains this")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    results = run(args.filter)
+    if args.compare:
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} kernel(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+    if args.save:
+        save(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
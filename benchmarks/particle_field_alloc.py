@@ -0,0 +1,58 @@
+"""
+Per-step memory churn and timing of the ParticleField simulation.
+
+    python -m benchmarks.particle_field_alloc
+
+tracemalloc sees every NumPy buffer, so the traced peak above the
+footprint before a step is what that step allocated and freed again.
+With the preallocated work buffers it stays near zero at every grid size,
+and the time per step grows linearly with the particle count.
+"""
+import time
+import tracemalloc
+
+from benchmarks.common import load_settings, make_host, synthetic_features
+
+GRID_SIZES = (1, 2, 3, 4, 6)
+STEPS = 200
+WARMUP = 30
+
+def make_field(grid_size):
+    settings = load_settings("particle_field", particle_field={"grid_size": grid_size})
+    return make_host(settings).active_visualizer
+
+def measure(grid_size, features):
+    field = make_field(grid_size)
+    # let the wavefront lists reach their steady-state length first
+    for audio_features in features[:WARMUP]:
+        field.simulate(audio_features)
+
+    start = time.perf_counter()
+    for audio_features in features[WARMUP:]:
+        field.simulate(audio_features)
+    step_ms = (time.perf_counter() - start) / (len(features) - WARMUP) * 1000
+
+    tracemalloc.start()
+    transient = []
+    for audio_features in features[WARMUP:]:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        field.simulate(audio_features)
+        _, peak = tracemalloc.get_traced_memory()
+        transient.append(peak - before)
+    tracemalloc.stop()
+
+    particles = field.grid_w * field.grid_h
+    return particles, step_ms, max(transient), sum(transient) / len(transient)
+
+def main():
+    features = synthetic_features(STEPS + WARMUP)
+    print(f"{'grid':>4} {'particles':>9} {'ms/step':>8} {'us/particle':>11} {'peak KiB':>9} {'mean KiB':>9}")
+    for grid_size in GRID_SIZES:
+        particles, step_ms, peak, mean = measure(grid_size, features)
+        print(f"{grid_size:>4} {particles:>9} {step_ms:>8.3f} {step_ms * 1000 / particles:>11.4f} "
+              f"{peak / 1024:>9.1f} {mean / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
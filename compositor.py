@@ -0,0 +1,91 @@
+import time
+import pygame
+
+from visualizers import VISUALIZERS
+
+class HostView:
+    """
+    What one layer's visualizer sees as its host: every attribute of the
+    real host, except that screen and SCREEN_WIDTH/SCREEN_HEIGHT are
+    narrowed to the layer's region. The screen is a subsurface, so drawing
+    is clipped to the region and lands directly in the shared frame.
+    """
+    def __init__(self, host, rect):
+        self.host = host
+        self.rect = rect
+        self.screen = host.screen.subsurface(rect)
+        self.SCREEN_WIDTH, self.SCREEN_HEIGHT = rect.size
+
+    def __getattr__(self, name):
+        return getattr(self.host, name)
+
+
+class Layer:
+    def __init__(self, host, layer_settings):
+        self.name = layer_settings["visualizer"]
+        # the region is [x, y, width, height] as fractions of the screen
+        x, y, w, h = layer_settings["region"]
+        screen_rect = host.screen.get_rect()
+        rect = pygame.Rect(round(x * host.SCREEN_WIDTH), round(y * host.SCREEN_HEIGHT),
+                           max(1, round(w * host.SCREEN_WIDTH)), max(1, round(h * host.SCREEN_HEIGHT))).clip(screen_rect)
+        if not rect.width or not rect.height:  # fully off screen, keep a 1 pixel region so the visualizer can still run
+            rect = pygame.Rect(0, 0, 1, 1)
+        # a full-screen layer draws straight into the shared screen
+        self.view = host if rect == screen_rect else HostView(host, rect)
+        self.visualizer = VISUALIZERS[self.name](self.view)
+        self.update_ms = 0.0
+        self.draw_ms = 0.0
+
+    @property
+    def quality_levels(self):
+        return getattr(self.visualizer, "quality_levels", None) or []
+
+
+class Compositor:
+    """
+    Stacks the visualizers listed in the "layers" setting, drawn in list
+    order so later layers end up on top. The host computes the audio
+    features once per frame and the compositor hands the same dicts to
+    every layer, then the host presents the combined frame once.
+    """
+    def __init__(self, visualizer, layers=None):
+        self.visualizer = visualizer
+        if layers is None:
+            layers = [Layer(visualizer, layer_settings) for layer_settings in visualizer.settings["layers"]]
+        self.layers = layers
+        # layers that don't need every chunk still cope with them, like before batching existed
+        self.consumes_sequence = any(getattr(layer.visualizer, "consumes_sequence", False) for layer in self.layers)
+
+    @property
+    def quality_levels(self):
+        # the longest ladder among the layers, the others clamp the level to their own
+        return max((layer.quality_levels for layer in self.layers), key=len)
+
+    def set_quality(self, level):
+        for layer in self.layers:
+            if layer.quality_levels:
+                layer.visualizer.set_quality(level)
+
+    def update_settings(self):
+        for layer in self.layers:
+            layer.visualizer.update_settings()
+
+    def is_settled(self):
+        return all(getattr(layer.visualizer, "is_settled", lambda: False)() for layer in self.layers)
+
+    def update(self, audio_features):
+        for layer in self.layers:
+            start = time.perf_counter()
+            layer.visualizer.update(audio_features)
+            layer.update_ms += (time.perf_counter() - start) * 1000
+
+    def draw(self):
+        for layer in self.layers:
+            start = time.perf_counter()
+            layer.visualizer.draw()
+            layer.draw_ms = (time.perf_counter() - start) * 1000
+        self.visualizer.metrics["layers"] = [
+            {"visualizer": layer.name, "update_ms": layer.update_ms, "draw_ms": layer.draw_ms} for layer in self.layers
+        ]
+        for layer in self.layers:
+            layer.update_ms = 0.0
@@ -1,19 +1,47 @@
 import json
+import hashlib
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from threading import Thread
-from ctypes import windll
+from threading import Thread, Timer, Lock
+try:
+    from ctypes import windll
+except ImportError:  # offline tools import the schema without the Windows API
+    windll = None
 import time
 import os
 
+VISUALIZER_NAMES = ["blackhole", "soundwaves", "freq_spikes", "particle_field", "perlinfield", "pitch_spikes", "spectrogram", "spirograph"]
+
 SETTING_SCHEMA = {
-    "active_visualizer": {"type": str, "valid_values": ["blackhole", "soundwaves", "freq_spikes", "particle_field"]},
+    "active_visualizer": {"type": str, "valid_values": VISUALIZER_NAMES},
     "color_scheme": {"type": str, "valid_values": ["fade", "static"]},
     "static_color": {"type": list, "length": 3, "tuple_range": [(0, 255), (0, 255), (0, 255)]},
     "fade_cycle": {"type": str, "valid_values": ["rainbow", "rgb", "warm", "cool"]},
     "fade_speed": {"type": int, "range": (1, 50)},
     "volume_sensitivity": {"type": int, "range": (0, 100)},
     "keep_topmost": {"type": bool},
+    "render_scale": {"type": (int, float), "range": (0.25, 1)},
+    "adaptive_quality": {"type": bool},
+    "multichannel": {"type": bool},
+    "pipelined": {"type": bool},
+    "seed": {"type": int, "range": (-1, 2**31 - 1)},  # -1 seeds from the OS, so every run differs
+    "layers": {  # when not empty, these are stacked in order instead of the active visualizer
+        "type": list,
+        "items": {
+            "type": dict,
+            "sub_keys": {
+                "visualizer": {"type": str, "valid_values": VISUALIZER_NAMES},
+                "region": {"type": list, "length": 4, "tuple_range": [(0, 1), (0, 1), (0, 1), (0, 1)]}
+            }
+        }
+    },
+    "display": {
+        "type": dict,
+        "sub_keys": {
+            "monitors": {"type": list, "items": {"type": int, "range": (0, 15)}},  # screeninfo order, 0 is the first
+            "span": {"type": bool}  # one visualizer across all the monitors instead of one each
+        }
+    },
     "freq_spikes": {
         "type": dict,
         "sub_keys": {
@@ -21,6 +49,7 @@ SETTING_SCHEMA = {
             "mirror_y": {"type": bool},
             "invert_x_mirror": {"type": bool},
             "invert_y_mirror": {"type": bool},
+            "stereo": {"type": bool},
             "bins": {"type": int, "range": (10, 400)}
         }
     },
@@ -40,25 +69,88 @@ SETTING_SCHEMA = {
             "edge_waves": {"type": bool},
             "radial_waves": {"type": bool}
         }
+    },
+    "perlinfield": {
+        "type": dict,
+        "sub_keys": {
+            "max_rows": {"type": int, "range": (1, 64)},
+            "x_step": {"type": int, "range": (1, 16)}
+        }
+    },
+    "pitch_spikes": {
+        "type": dict,
+        "sub_keys": {
+            "bins": {"type": int, "range": (10, 400)}
+        }
+    },
+    "spectrogram": {
+        "type": dict,
+        "sub_keys": {
+            "history": {"type": int, "range": (32, 2048)},
+            "scale": {"type": str, "valid_values": ["log", "linear"]},
+            "placement": {"type": str, "valid_values": ["bottom", "center", "top"]},
+            "height": {"type": (int, float), "range": (0.05, 1)}
+        }
+    },
+    "spirograph": {
+        "type": dict,
+        "sub_keys": {
+            "trail": {"type": (int, float), "range": (0.5, 0.99)}  # brightness left after each frame
+        }
+    },
+    "idle": {
+        "type": dict,
+        "sub_keys": {
+            "enabled": {"type": bool},
+            "after_seconds": {"type": int, "range": (1, 3600)},
+            "fps": {"type": int, "range": (1, 30)}
+        }
+    },
+    "broadcast": {
+        "type": dict,
+        "sub_keys": {
+            "enabled": {"type": bool},
+            "port": {"type": int, "range": (1024, 65535)},
+            "bars": {"type": int, "range": (1, 512)}
+        }
+    },
+    "profiling": {
+        "type": dict,
+        "sub_keys": {
+            "enabled": {"type": bool},
+            "mode": {"type": str, "valid_values": ["sampling", "cprofile"]},
+            "duration": {"type": int, "range": (1, 600)},
+            "interval_ms": {"type": int, "range": (1, 100)}
+        }
     }
 }
 
 class MyHandler(FileSystemEventHandler):
+    DEBOUNCE_SECONDS = 0.25
+
     def __init__(self, config_obj):
         self.config_obj = config_obj
-        self.error_flag = False
+        self.timer = None
+        self.lock = Lock()
 
     def process(self, event):
         if os.path.basename(event.src_path) == os.path.basename(self.config_obj.filepath):
-            if not self.error_flag:  # skips the next trigger after thread resumes
-                self.config_obj.load_from_file()
-                #self.config_obj.visualizer.process_config_change()
-            else:
-                self.error_flag = False
+            # editors emit several events per save, so only reload once they go quiet
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                self.timer = Timer(self.DEBOUNCE_SECONDS, self.config_obj.load_from_file)
+                self.timer.daemon = True
+                self.timer.start()
 
     def on_modified(self, event):
         self.process(event)
 
+    def cancel(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+
 
 class Config:
     def __init__(self, visualizer, filepath='config.json'):
@@ -70,11 +162,22 @@ class Config:
             "fade_speed": 3,
             "volume_sensitivity": 50,
             "keep_topmost": False,
+            "render_scale": 1.0,
+            "adaptive_quality": True,
+            "multichannel": False,
+            "pipelined": False,
+            "seed": -1,
+            "layers": [],
+            "display": {
+                "monitors": [0],
+                "span": False
+            },
             "freq_spikes": {
                 "mirror_x": False,
                 "mirror_y": False,
                 "invert_x_mirror": False,
                 "invert_y_mirror": False,
+                "stereo": False,
                 "bins": 120
             },
             "blackhole": {
@@ -87,11 +190,44 @@ class Config:
                 "zoom_factor": 4,
                 "edge_waves": True,
                 "radial_waves": True
+            },
+            "perlinfield": {
+                "max_rows": 24,
+                "x_step": 4
+            },
+            "pitch_spikes": {
+                "bins": 120
+            },
+            "spectrogram": {
+                "history": 480,
+                "scale": "log",
+                "placement": "bottom",
+                "height": 0.3
+            },
+            "spirograph": {
+                "trail": 0.94
+            },
+            "idle": {
+                "enabled": True,
+                "after_seconds": 10,
+                "fps": 10
+            },
+            "broadcast": {
+                "enabled": False,
+                "port": 50505,
+                "bars": 64
+            },
+            "profiling": {
+                "enabled": False,
+                "mode": "sampling",
+                "duration": 10,
+                "interval_ms": 5
             }
         }
         self.settings = self.default_settings.copy()
         self.visualizer = visualizer
         self.filepath = filepath
+        self.file_hash = None
 
         # Watchdog setup
         self.event_handler = MyHandler(self)
@@ -105,79 +241,114 @@ class Config:
         self.load_from_file(startup=True)
 
     def stop_observer(self):
+        self.event_handler.cancel()
         self.observer.stop()
         self.observer.join()
 
     def load_from_file(self, startup=False):
+        settings = self.settings
         try:
-            with open(self.filepath, 'r') as f:
-                try:
-                    self.settings = json.load(f)
-                    #print(f"Configuration loaded: {self.settings}")
-                except json.JSONDecodeError as e:
-                    self.settings = self.default_settings
-                    #windll.user32.MessageBoxW(0, f"Config validation failed (continuing with default settings). Reason: {e}", u"Error", 0)
-                    #print(f"Failed to load configuration: {e}")
+            with open(self.filepath, 'rb') as f:
+                contents = f.read()
         except FileNotFoundError as e:
             windll.user32.MessageBoxW(0, f"Config file not found. {e}", u"Error", 0)
+        else:
+            # saves that don't change the contents are skipped, including repeat saves of an invalid file
+            file_hash = hashlib.sha1(contents).hexdigest()
+            if not startup and file_hash == self.file_hash:
+                return
+            self.file_hash = file_hash
+            try:
+                settings = json.loads(contents)
+                #print(f"Configuration loaded: {settings}")
+            except json.JSONDecodeError as e:
+                settings = self.default_settings
+                #windll.user32.MessageBoxW(0, f"Config validation failed (continuing with default settings). Reason: {e}", u"Error", 0)
+                #print(f"Failed to load configuration: {e}")
 
-        errors = self.validate_settings(self.settings, SETTING_SCHEMA)
+        errors = self.validate_settings(settings, SETTING_SCHEMA)
         if errors:
-            self.event_handler.error_flag = True
-            self.settings = self.default_settings
+            settings = self.default_settings
             windll.user32.MessageBoxW(0, f"Config validation failed (continuing with default settings). Reason: {errors[0]}", u"Error", 0)
 
-        self.visualizer.settings = self.settings
-        if not startup:
-            self.visualizer.set_visualizer()
-            self.visualizer.process_config_change()
+        if startup:
+            self.settings = settings
+            self.visualizer.settings = settings
+            return
+
+        # only the changed keys go to the render loop, which applies them between frames
+        changes = diff_settings(self.settings, settings)
+        self.settings = settings
+        if changes:
+            self.visualizer.config_queue.put((settings, changes))
 
     def get(self, key, default=None):
         return self.settings.get(key, default)
 
     def validate_settings(self, settings, schema, prefix=''):
-        errors = []
-        for key, rule in schema.items():
-            full_key = f"{prefix}.{key}" if prefix else key  # For better error messages
-
-            # Check if the key exists in the settings
-            if key not in settings:
-                errors.append(f"Missing key: '{full_key}'")
-                continue  # Skip to the next iteration, no point in validating this key
-
-            value = settings[key]
-            expected_type = rule.get("type")
-
-            # Check if the type matches
-            if not isinstance(value, expected_type):
-                errors.append(f"Invalid type for '{full_key}'. Expected {expected_type}, got {type(value)}")
-                return errors
-
-            # Check against a list of valid values
-            if "valid_values" in rule and value not in rule["valid_values"]:
-                errors.append(f"Invalid value for '{full_key}'. Must be one of {rule['valid_values']}")
-
-            if expected_type == list:
-                if "length" in rule and len(value) != rule["length"]:
-                    errors.append(f"Invalid length for '{full_key}'. Expected length {rule['length']}, got {len(value)}")
-
-                if "tuple_range" in rule:
-                    for i, (min_val, max_val) in enumerate(rule["tuple_range"]):
-                        if not (min_val <= value[i] <= max_val):
-                            errors.append(f"Invalid value for '{full_key}[{i}]'. Must be between {min_val} and {max_val}")
-
-            # Check against a range
-            if "range" in rule:
-                min_val, max_val = rule["range"]
-                if not (min_val <= value <= max_val):
-                    errors.append(f"Invalid value for '{full_key}'. Must be between {min_val} and {max_val}")
-
-            # Validate sub-keys if it's a dictionary
-            if "sub_keys" in rule and isinstance(value, dict):
-                sub_errors = self.validate_settings(value, rule["sub_keys"], full_key)
-                errors.extend(sub_errors)
-
-        return errors
+        return validate_settings(settings, schema, prefix)
+
+
+def diff_settings(old, new):
+    """Returns the keys whose values differ, as 'key' or 'section.sub_key' for nested settings."""
+    changes = set()
+    for key, value in new.items():
+        old_value = old.get(key)
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            changes.update(f"{key}.{sub_key}" for sub_key in value if value[sub_key] != old_value.get(sub_key))
+        elif value != old_value:
+            changes.add(key)
+    return changes
+
+def validate_settings(settings, schema, prefix=''):
+    errors = []
+    for key, rule in schema.items():
+        full_key = f"{prefix}.{key}" if prefix else key  # For better error messages
+
+        # Check if the key exists in the settings
+        if key not in settings:
+            errors.append(f"Missing key: '{full_key}'")
+            continue  # Skip to the next iteration, no point in validating this key
+
+        value = settings[key]
+        expected_type = rule.get("type")
+
+        # Check if the type matches
+        if not isinstance(value, expected_type):
+            errors.append(f"Invalid type for '{full_key}'. Expected {expected_type}, got {type(value)}")
+            return errors
+
+        # Check against a list of valid values
+        if "valid_values" in rule and value not in rule["valid_values"]:
+            errors.append(f"Invalid value for '{full_key}'. Must be one of {rule['valid_values']}")
+
+        if expected_type == list:
+            if "length" in rule and len(value) != rule["length"]:
+                errors.append(f"Invalid length for '{full_key}'. Expected length {rule['length']}, got {len(value)}")
+
+            if "tuple_range" in rule:
+                for i, (min_val, max_val) in enumerate(rule["tuple_range"]):
+                    if not (min_val <= value[i] <= max_val):
+                        errors.append(f"Invalid value for '{full_key}[{i}]'. Must be between {min_val} and {max_val}")
+
+        # Check against a range
+        if "range" in rule:
+            min_val, max_val = rule["range"]
+            if not (min_val <= value <= max_val):
+                errors.append(f"Invalid value for '{full_key}'. Must be between {min_val} and {max_val}")
+
+        # Validate sub-keys if it's a dictionary
+        if "sub_keys" in rule and isinstance(value, dict):
+            sub_errors = validate_settings(value, rule["sub_keys"], full_key)
+            errors.extend(sub_errors)
+
+        # Validate every element of a list against the item rule, reported as 'key.index'
+        if "items" in rule and isinstance(value, list):
+            items = {str(i): item for i, item in enumerate(value)}
+            item_errors = validate_settings(items, {index: rule["items"] for index in items}, full_key)
+            errors.extend(item_errors)
+
+    return errors
 
 if __name__ == "__main__":
     config = Config()
@@ -0,0 +1,104 @@
+import time
+import pygame
+
+from compositor import Compositor, HostView, Layer
+
+def select_monitors(monitors, indices):
+    """The monitors at `indices` (screeninfo order), falling back to the first monitor if none of them exist."""
+    selected = [monitors[i] for i in dict.fromkeys(indices) if 0 <= i < len(monitors)]
+    return selected or monitors[:1]
+
+def bounding_box(monitors):
+    """Desktop rect covering all the monitors. Its origin can be negative for monitors left of or above the primary."""
+    rects = [pygame.Rect(monitor.x, monitor.y, monitor.width, monitor.height) for monitor in monitors]
+    return rects[0].unionall(rects[1:])
+
+
+class RegionHost(HostView):
+    """
+    The host as one display region's visualizer sees it: the region's own
+    render target and size, everything else from the real host.
+    """
+    def __init__(self, host, rect):
+        self.host = host
+        self.rect = rect
+        self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT = rect.size
+        self.SCREEN_WIDTH = max(1, round(rect.width * host.render_scale))
+        self.SCREEN_HEIGHT = max(1, round(rect.height * host.render_scale))
+        # the region of the window this host presents into
+        self.target = host.display.subsurface(rect)
+        if (self.SCREEN_WIDTH, self.SCREEN_HEIGHT) == rect.size:
+            self.screen = self.target
+        else:
+            self.screen = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT), 0, host.display)
+
+
+class DisplayRegion(Layer):
+    """
+    A part of the window with its own visualizer and render target: one
+    monitor, or the span of several. `monitor_rects` are the window rects
+    actually on a monitor. Only those get filled and presented, so the
+    gaps of a spanning window cost nothing. Once the visualizer reports
+    it has settled and that frame has been presented in the current
+    colour, the region isn't drawn or presented again until it changes.
+    """
+    def __init__(self, host, name, rect, monitor_rects):
+        self.name = name
+        self.view = RegionHost(host, rect)
+        self.visualizer = host.build_visualizer(self.view)
+        self.monitor_rects = monitor_rects
+        scale = host.render_scale
+        self.fill_rects = [pygame.Rect(round((r.x - rect.x) * scale), round((r.y - rect.y) * scale),
+                                       round(r.width * scale), round(r.height * scale)) for r in monitor_rects]
+        self.presented_settled = False
+        self.presented_color = None
+        self.presented = False
+        self.update_ms = 0.0
+        self.draw_ms = 0.0
+
+    def draw(self):
+        """Draws the region if it can have changed and returns the window rects to present."""
+        settled = getattr(self.visualizer, "is_settled", lambda: False)()
+        color = tuple(self.view.color)
+        self.presented = not (settled and self.presented_settled and color == self.presented_color)
+        if not self.presented:
+            return []
+        self.presented_settled = settled
+        self.presented_color = color
+        screen = self.view.screen
+        for rect in self.fill_rects:
+            screen.fill(self.view.fuchsia, rect)
+        self.visualizer.draw()
+        if screen is not self.view.target:
+            # nearest-neighbour, so colour-keyed pixels stay exactly fuchsia
+            pygame.transform.scale(screen, self.view.target.get_size(), self.view.target)
+        return self.monitor_rects
+
+
+class DisplayRegions(Compositor):
+    """
+    Runs one visualizer per display region of a window that covers several
+    monitors, sharing the audio features like layers do. draw() returns the
+    dirty window rects for pygame.display.update() instead of the host
+    filling and flipping the whole bounding box.
+    """
+    def __init__(self, visualizer):
+        if visualizer.settings["display"]["span"]:
+            regions = [DisplayRegion(visualizer, "span", visualizer.display.get_rect(), visualizer.monitor_rects)]
+        else:
+            regions = [DisplayRegion(visualizer, f"display{i}", rect, [rect]) for i, rect in enumerate(visualizer.monitor_rects)]
+        super().__init__(visualizer, regions)
+
+    def draw(self):
+        dirty_rects = []
+        for region in self.layers:
+            start = time.perf_counter()
+            dirty_rects.extend(region.draw())
+            region.draw_ms = (time.perf_counter() - start) * 1000
+        self.visualizer.metrics["displays"] = [
+            {"region": region.name, "presented": region.presented, "update_ms": region.update_ms, "draw_ms": region.draw_ms}
+            for region in self.layers
+        ]
+        for region in self.layers:
+            region.update_ms = 0.0
+        return dirty_rects
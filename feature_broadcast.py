@@ -0,0 +1,135 @@
+"""
+Streams the analysed audio features over local UDP, so other programs
+(LED strips, ...) can reuse them instead of capturing and analysing the
+audio a second time.
+
+    python feature_broadcast.py                 # reference subscriber, reports rate and loss
+    python feature_broadcast.py --port 50505 --seconds 30
+
+Every datagram carries one analysed chunk, little-endian:
+
+    header   4s  magic b"DAVF"
+             I   sequence number, wraps at 2**32
+             d   capture time, seconds since the epoch
+             f   rms, f peak, f pitch (Hz)
+             H   number of bars
+    bars     float32 * bars, the spectrum folded into log-spaced bands
+"""
+import argparse
+import socket
+import struct
+import time
+import numpy as np
+
+MAGIC = b"DAVF"
+HEADER = struct.Struct("<4sIdfffH")
+DEFAULT_PORT = 50505
+
+def band_starts(n_bins, bars):
+    """First spectrum bin of each of up to `bars` log-spaced bands, skipping DC. Narrow low bands merge, so fewer may come back."""
+    return np.unique(np.geomspace(1, n_bins, bars + 1).astype(int)[:-1])
+
+
+class FeaturePublisher:
+    """
+    Sends one datagram per analysed chunk to a local port. The socket is
+    non-blocking and a send that fails (full buffer, nobody listening) only
+    counts as dropped, so publishing can never stall the render loop.
+    """
+    def __init__(self, port=DEFAULT_PORT, bars=64, host="127.0.0.1"):
+        self.address = (host, port)
+        self.bars = bars
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+        self.n_bins = None
+
+    def allocate_packet(self, n_bins):
+        # the bars are reduced straight into the packet buffer
+        self.n_bins = n_bins
+        self.starts = band_starts(n_bins, self.bars)
+        self.packet = bytearray(HEADER.size + 4 * len(self.starts))
+        self.packet_bars = np.frombuffer(self.packet, dtype="<f4", offset=HEADER.size)
+
+    def publish(self, audio_features):
+        amps = audio_features["amps"]
+        if len(amps) != self.n_bins:
+            self.allocate_packet(len(amps))
+        np.maximum.reduceat(amps, self.starts, out=self.packet_bars)
+        HEADER.pack_into(self.packet, 0, MAGIC, self.sequence, time.time(), audio_features["volume"],
+                         audio_features["peak"], audio_features["pitch"], len(self.starts))
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        try:
+            self.socket.sendto(self.packet, self.address)
+            self.sent += 1
+        except OSError:
+            self.dropped += 1
+
+    def close(self):
+        self.socket.close()
+
+
+def unpack(packet):
+    """Decodes one datagram into a dict, or returns None if it isn't a feature packet."""
+    if len(packet) < HEADER.size:
+        return None
+    magic, sequence, timestamp, rms, peak, pitch, n_bars = HEADER.unpack_from(packet)
+    if magic != MAGIC or len(packet) != HEADER.size + 4 * n_bars:
+        return None
+    return {"sequence": sequence, "timestamp": timestamp, "rms": rms, "peak": peak, "pitch": pitch,
+            "bars": np.frombuffer(packet, dtype="<f4", offset=HEADER.size)}
+
+def subscribe(port=DEFAULT_PORT, host="127.0.0.1", seconds=None, report_every=1.0):
+    """Reference subscriber: receives packets and prints the packet rate, loss and latency once per report_every seconds."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    sock.settimeout(report_every)
+    print(f"listening on {host}:{port}")
+
+    expected = None
+    received = lost = out_of_order = 0
+    latencies = []
+    start = last_report = time.perf_counter()
+    while seconds is None or time.perf_counter() - start < seconds:
+        try:
+            packet = sock.recv(65535)
+        except socket.timeout:
+            packet = None
+        if packet is not None:
+            frame = unpack(packet)
+            if frame is not None:
+                received += 1
+                latencies.append((time.time() - frame["timestamp"]) * 1000)
+                gap = 0 if expected is None else (frame["sequence"] - expected) & 0xFFFFFFFF
+                if gap >= 0x80000000:  # behind what was already seen, counted as lost when it was skipped
+                    out_of_order += 1
+                else:
+                    lost += gap
+                    expected = (frame["sequence"] + 1) & 0xFFFFFFFF
+
+        now = time.perf_counter()
+        if now - last_report >= report_every:
+            elapsed = now - last_report
+            total = received + lost
+            loss = lost / total if total else 0.0
+            latency = sum(latencies) / len(latencies) if latencies else 0.0
+            print(f"{received / elapsed:7.1f} packets/s  lost {lost:5d} ({loss:6.2%})  "
+                  f"out of order {out_of_order:4d}  latency {latency:6.2f} ms", flush=True)
+            received = lost = out_of_order = 0
+            latencies.clear()
+            last_report = now
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reference subscriber for the visualizer's feature broadcast.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--seconds", type=float, default=None, help="stop after this long (default: run until interrupted)")
+    args = parser.parse_args()
+    try:
+        subscribe(args.port, args.host, args.seconds)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,97 @@
+"""
+Precomputed feature tracks for recorded audio.
+
+    python feature_tracks.py song.wav                 # writes song.tracks/
+    pythonw "Desktop Audio Visualizer.pyw" song.tracks
+
+A track directory holds one .npy array per feature, indexed by hop, and
+a meta.json. Tracks are opened memory-mapped, so large files open
+instantly and each hop's features are views into the mapping.
+"""
+import argparse
+import json
+import os
+import numpy as np
+
+from audio_analysis import AudioAnalyzer, load_wav
+
+CHUNK = 2048
+TRACK_VERSION = 2
+
+# feature name -> (dtype, shape of one hop given the chunk size)
+TRACK_FEATURES = {
+    "fft": (np.complex64, lambda chunk: (chunk // 2 + 1,)),
+    "amps": (np.float32, lambda chunk: (chunk // 2 + 1,)),
+    "pitch": (np.float32, lambda chunk: ()),
+    "volume": (np.float32, lambda chunk: ()),
+    "peak": (np.float32, lambda chunk: ())
+}
+
+def build_tracks(wav_path, out_dir=None, chunk=CHUNK, batch=512):
+    """Analyzes a wav file in vectorized batches of hops and writes its feature tracks to out_dir."""
+    if out_dir is None:
+        out_dir = os.path.splitext(wav_path)[0] + ".tracks"
+    samples, rate = load_wav(wav_path)
+    n_hops = len(samples) // chunk
+    if not n_hops:
+        raise ValueError(f"{wav_path} is shorter than one chunk ({chunk} samples), there is nothing to analyze")
+    analyzer = AudioAnalyzer(rate, chunk)
+
+    os.makedirs(out_dir, exist_ok=True)
+    columns = {}
+    for name, (dtype, hop_shape) in TRACK_FEATURES.items():
+        path = os.path.join(out_dir, f"{name}.npy")
+        columns[name] = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n_hops,) + hop_shape(chunk))
+
+    # written straight into the mapped columns, so the whole track never has to fit in memory
+    for start in range(0, n_hops, batch):
+        stop = min(start + batch, n_hops)
+        frames = samples[start * chunk:stop * chunk].reshape(-1, chunk)
+        features = analyzer.process_batch(frames)
+        for name, column in columns.items():
+            column[start:stop] = features[name]
+
+    for column in columns.values():
+        column.flush()
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({"version": TRACK_VERSION, "rate": rate, "chunk": chunk, "hops": n_hops,
+                   "features": list(TRACK_FEATURES)}, f, indent=4)
+    return out_dir
+
+
+class FeatureTrackSource:
+    """
+    Replays a track directory as the feature dicts process_audio() returns,
+    with zero DSP cost. Indexing by hop gives views into the memory map.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != TRACK_VERSION:
+            raise ValueError(f"Unsupported feature track version: {meta['version']}")
+        if meta["hops"] < 1:
+            # replay loops over the hops, so an empty track has nothing to play
+            raise ValueError(f"Feature track {path} has no hops, its audio was shorter than one chunk")
+        self.path = path
+        self.rate = meta["rate"]
+        self.chunk = meta["chunk"]
+        self.hops = meta["hops"]
+        self.columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in meta["features"]}
+
+    def __len__(self):
+        return self.hops
+
+    def __getitem__(self, hop):
+        return {name: column[hop] for name, column in self.columns.items()}
+
+    def hop_at(self, seconds):
+        return int(seconds * self.rate) // self.chunk
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute memory-mapped feature tracks for a wav file.")
+    parser.add_argument("wav", help="input wav file")
+    parser.add_argument("--out", default=None, help="track directory (default: next to the wav as <name>.tracks)")
+    parser.add_argument("--chunk", type=int, default=CHUNK)
+    args = parser.parse_args()
+    print(build_tracks(args.wav, args.out, args.chunk))
@@ -0,0 +1,50 @@
+SILENCE_DB = -40  # the pitch detector's set_silence() gate
+
+class IdleMonitor:
+    """
+    Two-state machine fed with each chunk's RMS. It goes idle after
+    `after_seconds` of continuous silence and wakes on the first chunk
+    above the threshold, keeping count of wakeups and time spent idle.
+    """
+    ACTIVE = "active"
+    IDLE = "idle"
+
+    def __init__(self, after_seconds, threshold_db=SILENCE_DB):
+        self.after_seconds = after_seconds
+        self.threshold = 10 ** (threshold_db / 20)  # aubio's level is the RMS in dB
+        self.state = self.ACTIVE
+        self.silent_since = None
+        self.idle_since = None
+        self.wakeups = 0
+        self.idle_seconds = 0.0  # of completed idle stretches
+        self.idle_cpu_seconds = 0.0
+
+    @property
+    def idle(self):
+        return self.state == self.IDLE
+
+    def record(self, rms, now):
+        """Adds a chunk's RMS at time `now` (seconds) and returns True if the state changed."""
+        if rms >= self.threshold:
+            self.silent_since = None
+            if self.idle:
+                self.wake(now)
+                return True
+            return False
+        if self.silent_since is None:
+            self.silent_since = now
+        if not self.idle and now - self.silent_since >= self.after_seconds:
+            self.state = self.IDLE
+            self.idle_since = now
+            return True
+        return False
+
+    def wake(self, now):
+        self.state = self.ACTIVE
+        self.idle_seconds += now - self.idle_since
+        self.wakeups += 1
+
+    def total_idle_seconds(self, now):
+        if self.idle:
+            return self.idle_seconds + now - self.idle_since
+        return self.idle_seconds
@@ -0,0 +1,94 @@
+import threading
+from queue import Queue
+import numpy as np
+
+class DoubleBuffer:
+    """
+    Two copies of a visualizer's render state. The simulation thread
+    writes the back copy while draw() reads the front one, and swap()
+    exchanges them between frames.
+    """
+    def __init__(self):
+        self.buffers = [{}, {}]
+        self.sizes = [{}, {}]
+        self.front = 0
+
+    def write(self, name, array):
+        back = 1 - self.front
+        buffer = self.buffers[back].get(name)
+        if (buffer is None or len(buffer) < len(array)
+                or buffer.shape[1:] != array.shape[1:] or buffer.dtype != array.dtype):
+            # over-allocate so variable-length state (e.g. jet particles) doesn't reallocate every frame
+            buffer = np.empty((max(len(array), 16) * 2,) + array.shape[1:], dtype=array.dtype)
+            self.buffers[back][name] = buffer
+        buffer[:len(array)] = array
+        self.sizes[back][name] = len(array)
+
+    def read(self, name):
+        return self.buffers[self.front][name][:self.sizes[self.front][name]]
+
+    def swap(self):
+        self.front = 1 - self.front
+
+
+class SimulationPipeline:
+    """
+    Runs the visualizer's update() for frame N+1 on a worker thread while
+    the main thread draws and flips frame N. The NumPy-heavy simulation
+    releases the GIL, so the two stages overlap on multi-core machines.
+    Visualizers opt in with publish_state(), which copies what draw() needs
+    into self.state.
+    """
+    def __init__(self, visualizer):
+        self.visualizer = visualizer
+        self.state = DoubleBuffer()
+        self.jobs = Queue(maxsize=1)
+        self.idle = threading.Event()
+        self.idle.set()
+        self.pending = False
+        self.error = None
+
+        visualizer.state = self.state
+        visualizer.publish_state()
+        self.state.swap()
+
+        self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+        self.thread.start()
+
+    def step(self, features):
+        """Once per frame: hands the finished simulation to draw() and starts the next one on `features`."""
+        if self.pending:
+            self.wait()
+            self.state.swap()
+            self.pending = False
+        if features:
+            self.idle.clear()
+            self.pending = True
+            self.jobs.put(features)
+
+    def wait(self):
+        """Blocks until no simulation step is running. The main thread must call this before touching the visualizer."""
+        self.idle.wait()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        while True:
+            features = self.jobs.get()
+            if features is None:
+                break
+            try:
+                for audio_features in features:
+                    self.visualizer.update(audio_features)
+                self.visualizer.publish_state()
+            except Exception as e:
+                self.error = e
+            finally:
+                self.idle.set()
+
+    def stop(self):
+        self.idle.wait()
+        self.jobs.put(None)
+        self.thread.join()
+        self.visualizer.state = None
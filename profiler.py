@@ -0,0 +1,94 @@
+"""
+On-demand profiling of the running overlay, switched on from the
+"profiling" section of config.json and picked up by the hot reload.
+
+"sampling" snapshots the stack of every thread (the main loop, the audio
+reader, the simulation worker) each interval_ms and writes collapsed
+stacks, one "thread;outer;...;inner count" line per distinct stack, for
+flamegraph.pl or speedscope. The overhead is one stack walk per interval.
+
+"cprofile" runs cProfile on the main thread, which covers the main loop
+and the visualizer, and writes a .pstats file for pstats or snakeviz.
+
+Output goes to profiles/<timestamp>_<visualizer>.collapsed|.pstats.
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_DIR = "profiles"
+
+class SamplingProfiler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self, path):
+        self.stopped.set()
+        self.thread.join()
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self, path):
+        self.profile.disable()
+        self.profile.dump_stats(path)
+
+
+class ProfileSession:
+    """One bounded profiling window. Start and stop it from the main thread, which cProfile needs."""
+    EXTENSIONS = {"sampling": ".collapsed", "cprofile": ".pstats"}
+
+    def __init__(self, mode, duration, interval_ms, label, directory=PROFILE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(directory, f"{timestamp}_{label}{self.EXTENSIONS[mode]}")
+        self.profiler = SamplingProfiler(interval_ms / 1000) if mode == "sampling" else CProfiler()
+        self.duration = duration
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.profiler.start()
+
+    def expired(self):
+        return time.perf_counter() - self.started >= self.duration
+
+    def stop(self):
+        """Ends the window and writes the output, returning its path."""
+        self.profiler.stop(self.path)
+        return self.path
@@ -0,0 +1,44 @@
+from collections import deque
+
+class QualityGovernor:
+    """
+    Watches rolling frame times against the fps budget and steps the
+    active visualizer's quality level down (higher level = cheaper) when
+    frames run over, and back up once there is headroom again.
+    """
+    def __init__(self, fps, window=30, downgrade_ratio=0.9, upgrade_ratio=0.5, upgrade_cooldown=300):
+        self.budget = 1000 / fps  # ms per frame
+        self.frame_times = deque(maxlen=window)
+        self.downgrade_ratio = downgrade_ratio
+        self.upgrade_ratio = upgrade_ratio
+        self.upgrade_cooldown = upgrade_cooldown  # frames to hold a level before stepping back up
+        self.frames_at_level = 0
+        self.level = 0
+        self.max_level = 0
+
+    def reset(self, max_level):
+        self.max_level = max_level
+        self.level = min(self.level, max_level)
+        self.frame_times.clear()
+        self.frames_at_level = 0
+
+    def record(self, frame_time):
+        """Adds a frame's work time in ms and returns True if the quality level changed."""
+        self.frame_times.append(frame_time)
+        self.frames_at_level += 1
+        if len(self.frame_times) < self.frame_times.maxlen:
+            return False
+
+        average = sum(self.frame_times) / len(self.frame_times)
+        if average > self.budget * self.downgrade_ratio and self.level < self.max_level:
+            self.level += 1
+        elif (average < self.budget * self.upgrade_ratio and self.level > 0
+                and self.frames_at_level >= self.upgrade_cooldown):
+            self.level -= 1
+        else:
+            return False
+
+        # the new level needs a fresh window before it can be judged
+        self.frame_times.clear()
+        self.frames_at_level = 0
+        return True
@@ -0,0 +1,149 @@
+"""
+Renders a visualizer over a wav file without a window or audio device.
+
+    python render_offline.py song.wav --out frames/
+    python render_offline.py song.wav --out - | ffmpeg -f rawvideo -pix_fmt rgb24 -s 1920x1080 -r 60 -i - clip.mp4
+    python render_offline.py song.tracks --out frames/
+
+The DSP for the whole file is computed up front across a process pool
+(or skipped entirely for a feature track directory from feature_tracks.py),
+then the simulation runs on a fixed timestep as fast as the CPU allows.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+# pygame prints a banner on import, which would corrupt raw frames on stdout
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+import pygame
+
+from audio_analysis import analyze_parallel, load_wav
+from color_manager import ColorFade
+from config_manager import SETTING_SCHEMA, validate_settings
+from feature_tracks import FeatureTrackSource
+from visualizers import VISUALIZERS
+from compositor import Compositor
+from seeding import make_rng
+
+CHUNK = 2048
+
+class OfflineHost:
+    """Provides the attributes visualizers read from the Visualizer, backed by plain surfaces."""
+    def __init__(self, settings, width, height, rate, chunk=CHUNK, background=(255, 0, 128)):
+        self.settings = settings
+        self.RATE = rate
+        self.CHUNK = chunk
+        self.DISPLAY_WIDTH = width
+        self.DISPLAY_HEIGHT = height
+        self.fuchsia = background
+        self.events = []
+        self.dt = 0
+        self.metrics = {}
+        self.setup_render_target()
+        self.sensitivity = settings["volume_sensitivity"]
+        self.color_scheme = settings["color_scheme"]
+        self.color = settings["static_color"]
+        self.colorfade = ColorFade(settings["fade_cycle"], settings["fade_speed"])
+        if settings["layers"]:
+            self.active_visualizer = Compositor(self)
+        else:
+            self.active_visualizer = VISUALIZERS[settings["active_visualizer"]](self)
+        self.active_visualizer.update_settings()
+
+    def make_rng(self, name):
+        return make_rng(self.settings["seed"], name)
+
+    def setup_render_target(self):
+        self.render_scale = self.settings["render_scale"]
+        self.SCREEN_WIDTH = max(1, round(self.DISPLAY_WIDTH * self.render_scale))
+        self.SCREEN_HEIGHT = max(1, round(self.DISPLAY_HEIGHT * self.render_scale))
+        self.display = pygame.Surface((self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT), 0, 32)
+        if (self.SCREEN_WIDTH, self.SCREEN_HEIGHT) == (self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT):
+            self.screen = self.display
+        else:
+            self.screen = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT), 0, 32)
+
+    def draw(self):
+        if self.color_scheme == "fade":
+            self.color = self.colorfade.next()
+        self.screen.fill(self.fuchsia)
+        self.active_visualizer.draw()
+        if self.screen is not self.display:
+            pygame.transform.scale(self.screen, (self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT), self.display)
+
+
+def load_settings(path):
+    with open(path, 'r') as f:
+        settings = json.load(f)
+    errors = validate_settings(settings, SETTING_SCHEMA)
+    if errors:
+        raise ValueError(f"Config validation failed. Reason: {errors[0]}")
+    return settings
+
+def render(features, host, fps, write_frame):
+    """Steps the visualizer through `features` on a fixed 1/fps timestep, handing each finished frame to write_frame."""
+    duration = len(features) * host.CHUNK / host.RATE
+    n_frames = int(duration * fps)
+    hop = 0
+    for frame in range(n_frames):
+        # feed every chunk that would have arrived by the end of this frame
+        arrived = min(int((frame + 1) / fps * host.RATE) // host.CHUNK, len(features))
+        while hop < arrived:
+            host.active_visualizer.update(features[hop])
+            hop += 1
+        host.dt = 1 / fps
+        host.draw()
+        write_frame(frame, host.display)
+    return n_frames
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a visualizer over a wav file, faster than real time.")
+    parser.add_argument("wav", help="input wav file or feature track directory")
+    parser.add_argument("--config", default="config.json", help="settings file (default: config.json)")
+    parser.add_argument("--out", required=True, help="directory for a png sequence, or - for raw RGB frames on stdout")
+    parser.add_argument("--size", default="1920x1080", help="output resolution (default: 1920x1080)")
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=None, help="DSP processes (default: one per CPU)")
+    parser.add_argument("--background", default="255,0,128", help="background colour as r,g,b (default: the colour key)")
+    args = parser.parse_args()
+
+    width, height = (int(x) for x in args.size.lower().split("x"))
+    background = tuple(int(x) for x in args.background.split(","))
+    settings = load_settings(args.config)
+
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))  # visualizers that poll the keyboard need a display
+
+    start = time.perf_counter()
+    if os.path.isdir(args.wav):
+        features = FeatureTrackSource(args.wav)
+        rate, chunk = features.rate, features.chunk
+    else:
+        samples, rate = load_wav(args.wav)
+        chunk = CHUNK
+        features = analyze_parallel(samples, rate, chunk, args.workers)
+    dsp_time = time.perf_counter() - start
+
+    host = OfflineHost(settings, width, height, rate, chunk, background=background)
+    if args.out == "-":
+        def write_frame(frame, surface):
+            sys.stdout.buffer.write(pygame.image.tostring(surface, "RGB"))
+    else:
+        os.makedirs(args.out, exist_ok=True)
+        def write_frame(frame, surface):
+            pygame.image.save(surface, os.path.join(args.out, f"frame_{frame:06d}.png"))
+
+    start = time.perf_counter()
+    n_frames = render(features, host, args.fps, write_frame)
+    render_time = time.perf_counter() - start
+
+    print(f"DSP: {len(features)} chunks in {dsp_time:.2f}s", file=sys.stderr)
+    print(f"Render: {n_frames} frames in {render_time:.2f}s ({n_frames / max(render_time, 1e-9):.1f} frames/sec, "
+          f"{n_frames / args.fps / max(render_time, 1e-9):.1f}x real time)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+import zlib
+import numpy as np
+
+def make_rng(seed, name):
+    """
+    A Generator for one named consumer of randomness. A seed of -1 draws
+    fresh entropy so every run differs. Otherwise the stream depends only on
+    the seed and the name, so one visualizer's draws never shift another's.
+    """
+    if seed < 0:
+        return np.random.default_rng()
+    return np.random.default_rng([seed, zlib.crc32(name.encode())])
@@ -0,0 +1,20 @@
+from visualizers.blackhole import BlackHole
+from visualizers.soundwaves import Soundwaves
+from visualizers.freq_spikes import FreqSpikes
+from visualizers.particle_field import ParticleField
+from visualizers.pitch_spikes import PitchSpikes
+from visualizers.spirograph import Spirograph
+from visualizers.perlinfield import PerlinField
+from visualizers.spectrogram import Spectrogram
+
+# name in config.json -> visualizer class
+VISUALIZERS = {
+    "blackhole": BlackHole,
+    "soundwaves": Soundwaves,
+    "freq_spikes": FreqSpikes,
+    "particle_field": ParticleField,
+    "perlinfield": PerlinField,
+    "pitch_spikes": PitchSpikes,
+    "spectrogram": Spectrogram,
+    "spirograph": Spirograph
+}
@@ -2,7 +2,8 @@ import math
 import pygame
 import pygame.gfxdraw
 import numpy as np
-import random
+from visualizers.culling import visible_mask
+from visualizers.surface_cache import SurfaceCache
 
 # emit soundwaves through the disk, brightening the color via pitch or amp; requires using distance from center formula
 # change jet particles to stay on their original path
@@ -11,17 +12,35 @@ import random
 class BlackHole:
     def __init__(self, visualizer):
         self.visualizer = visualizer
+        self.rng = visualizer.make_rng("blackhole")  # shared by the disk and the jets
         self.update_settings()
-        self.jets = Jet(visualizer)
-        self.accretion_disk = AccretionDisk(visualizer, self.num_disk_particles, self.inner_disk_radius, self.outer_disk_radius)
+        self.jets = Jet(visualizer, self.rng)
+        self.accretion_disk = AccretionDisk(visualizer, self.num_disk_particles, self.inner_disk_radius, self.outer_disk_radius, self.rng)
         self.accretion_disk.jets = self.jets
-        self.radius = 100
+        self.radius = int(100 * visualizer.render_scale)
         self.center = (visualizer.SCREEN_WIDTH//2,visualizer.SCREEN_HEIGHT//2)
+        self.cache = SurfaceCache(visualizer)
+        self.state = None  # DoubleBuffer when a SimulationPipeline runs update() on another thread
+        self.build_quality_levels()
 
     def update_settings(self):
+        # radii are configured in display pixels, geometry follows the internal render size
+        scale = self.visualizer.render_scale
         self.num_disk_particles = self.visualizer.settings["blackhole"]["disk_particles"]
-        self.inner_disk_radius = self.visualizer.settings["blackhole"]["inner_disk_radius"]
-        self.outer_disk_radius = self.visualizer.settings["blackhole"]["outer_disk_radius"]
+        self.inner_disk_radius = self.visualizer.settings["blackhole"]["inner_disk_radius"] * scale
+        self.outer_disk_radius = self.visualizer.settings["blackhole"]["outer_disk_radius"] * scale
+
+    def build_quality_levels(self):
+        # all disk particles keep simulating (cheap in numpy), the level only limits how many are drawn
+        self.quality_levels = [
+            {"disk_particles": int(self.num_disk_particles * fraction), "particle_rate": rate}
+            for fraction, rate in ((1, 30), (0.75, 22), (0.5, 15), (0.3, 8))
+        ]
+
+    def set_quality(self, level):
+        quality = self.quality_levels[min(level, len(self.quality_levels) - 1)]
+        self.accretion_disk.particle_system.draw_limit = quality["disk_particles"]
+        self.jets.particle_rate = quality["particle_rate"]
 
     def update(self, audio_features):
         volume = np.max(audio_features["amps"]) ** 1.3
@@ -34,21 +53,36 @@ class BlackHole:
         disk_normal = self.jets.particle_system.rotate_points_around_axis(self.accretion_disk.rotation_speed, self.accretion_disk.rotation_axis, self.accretion_disk.center, self.accretion_disk.disk_normal)
         self.jets.update(disk_normal)
 
+    def publish_state(self):
+        disk = self.accretion_disk.particle_system
+        self.state.write("disk", disk.positions[:disk.draw_limit])
+        self.state.write("jets", self.jets.particle_system.positions)
+
+    def draw_horizon(self, surface):
+        pygame.draw.circle(surface, (0,0,0), (self.radius, self.radius), self.radius)
+
     def draw(self):
-        pygame.draw.circle(self.visualizer.screen, (0,0,0), self.center, self.radius)
-        self.accretion_disk.draw()
-        self.jets.draw()
+        # the event horizon never changes, so it's rendered once and blitted
+        size = (2 * self.radius + 1, 2 * self.radius + 1)
+        self.cache.blit("horizon", (self.center[0] - self.radius, self.center[1] - self.radius), size, self.radius, self.draw_horizon)
+        if self.state is None:
+            self.accretion_disk.draw()
+            self.jets.draw()
+            return
+        self.accretion_disk.particle_system.draw(self.accretion_disk.color, self.state.read("disk"))
+        self.jets.particle_system.draw(self.visualizer.color, self.state.read("jets"))
 
 
 class AccretionDisk:
-    def __init__(self, visualizer, num_particles, inner_radius, outer_radius):
+    def __init__(self, visualizer, num_particles, inner_radius, outer_radius, rng):
         self.visualizer = visualizer
+        self.rng = rng
         self.screen_w = visualizer.SCREEN_WIDTH
         self.screen_h = visualizer.SCREEN_HEIGHT
         self.center = (self.screen_w//2,self.screen_h//2,0)
         self.color = self.visualizer.color
         self.setup_transformation_vars()
-        disk_positions = generate_disk_points(num_particles, inner_radius, outer_radius, self.center)
+        disk_positions = generate_disk_points(num_particles, inner_radius, outer_radius, self.center, rng)
         self.particle_system = ParticleSystem(visualizer, disk_positions)
         # self.rotate_from_start_pos(self, target_vector=np.array([0.1,0.9,0]))
 
@@ -82,9 +116,9 @@ class AccretionDisk:
 
     def randomize_rotation_axis(self):
         # slightly change the rotation axis at random intervals
-        if random.random() < 0.001:
-            axis = random.randint(0,2)
-            self.rotation_axis[axis] += random.uniform(-0.2, 0.2)
+        if self.rng.random() < 0.001:
+            axis = self.rng.integers(0, 2, endpoint=True)
+            self.rotation_axis[axis] += self.rng.uniform(-0.2, 0.2)
 
     def draw(self):
         self.particle_system.draw(self.color)
@@ -102,18 +136,21 @@ class AccretionDisk:
 
 
 class Jet:
-    def __init__(self, visualizer):
+    def __init__(self, visualizer, rng):
         self.visualizer = visualizer
+        self.rng = rng
         self.color = visualizer.color
         self.particle_rate = 30
-        jet_positions = generate_jet_positions(num_particles=1, jet_radius=10, jet_height=100, center=(visualizer.SCREEN_WIDTH/2, visualizer.SCREEN_HEIGHT/2))
+        self.scale = visualizer.render_scale
+        jet_positions = generate_jet_positions(num_particles=1, jet_radius=10*self.scale, jet_height=100*self.scale, min_height=100*self.scale, center=(visualizer.SCREEN_WIDTH/2, visualizer.SCREEN_HEIGHT/2), rng=rng)
         self.particle_system = ParticleSystem(visualizer, jet_positions)
         self.active = False
 
     def update(self, disk_normal):
         self.particle_system.update(disk_normal)
         if self.active:
-            new_points = [generate_new_jet_point(disk_normal) for i in range(self.particle_rate)]
+            center = self.particle_system.center
+            new_points = [generate_new_jet_point(disk_normal, center, self.rng, radius=20*self.scale, distance=50*self.scale) for i in range(self.particle_rate)]
             new_points_array = np.vstack(new_points)
             self.particle_system.positions = np.vstack([self.particle_system.positions, new_points_array])
 
@@ -127,22 +164,33 @@ class ParticleSystem:
         self.screen_w = visualizer.SCREEN_WIDTH
         self.screen_h = visualizer.SCREEN_HEIGHT
         self.center = (self.screen_w//2,self.screen_h//2,0)
+        self.scale = visualizer.render_scale
         self.positions = positions
+        self.draw_limit = None
 
     def update(self, disk_normal):
-        self.positions = translate_points_away_from_disk(self.positions, disk_normal, translation_speed=30)
+        self.positions = translate_points_away_from_disk(self.positions, disk_normal, self.center, translation_speed=30*self.scale)
         self.positions = self.remove_offscreen_particles(self.positions, self.screen_w, self.screen_h)
 
-    def draw(self, color): # 900, 500, 200
-        radius_squared = 10000
-        for position in self.positions:
-            int_position = [int(x) for x in position]
-            point2d = (int_position[0], position[1])
-            distance2d_squared = (point2d[0] - self.screen_w//2) ** 2 + (point2d[1] - self.screen_h//2) ** 2
-            distance3d_squared = distance2d_squared + position[2] ** 2
-            # if not inside sphere or behind it
-            if not (distance3d_squared <= radius_squared) and not (distance2d_squared <= radius_squared and position[2] < 100):
-                pygame.draw.circle(self.visualizer.screen, color, point2d, 1)
+    def draw(self, color, positions=None): # 900, 500, 200
+        # positions is a published copy of this system's state when the simulation runs on another thread
+        if positions is None:
+            positions = self.positions[:self.draw_limit]
+        if not len(positions):
+            return
+        horizon_radius = 100 * self.scale
+        radius_squared = horizon_radius ** 2
+        x = positions[:, 0].astype(int)
+        y = positions[:, 1]
+        z = positions[:, 2]
+        distance2d_squared = (x - self.screen_w//2) ** 2 + (y - self.screen_h//2) ** 2
+        distance3d_squared = distance2d_squared + z ** 2
+        # skip points inside the sphere or behind it, and points off screen
+        hidden = (distance3d_squared <= radius_squared) | ((distance2d_squared <= radius_squared) & (z < horizon_radius))
+        visible = visible_mask(x, y, self.screen_w, self.screen_h, margin=1)
+        visible &= ~hidden
+        for point2d in zip(x[visible].tolist(), y[visible].tolist()):
+            pygame.draw.circle(self.visualizer.screen, color, point2d, 1)
 
     def rotate_points_around_axis(self, angle, axis, center, disk_normal):
         center = np.array(center)
@@ -191,10 +239,10 @@ class ParticleSystem:
         return positions
 
 
-def generate_disk_points(num_points, min_radius, max_radius, center):
+def generate_disk_points(num_points, min_radius, max_radius, center, rng):
     center = np.array(center)
-    rand_radii = np.random.uniform(min_radius, max_radius, num_points)
-    rand_angles = np.random.uniform(0, 2*np.pi, num_points)
+    rand_radii = rng.uniform(min_radius, max_radius, num_points)
+    rand_angles = rng.uniform(0, 2*np.pi, num_points)
     x = rand_radii * np.cos(rand_angles) + center[0]
     y = rand_radii * np.sin(rand_angles) + center[1]
     z = np.zeros(num_points) + center[2]
@@ -236,8 +284,9 @@ def transform_disk(normal_vec, points, target_normal_vec):
     return new_points
 """
 
-def translate_points_away_from_disk(points, disk_normal, translation_speed=10, disk_center=np.array([960, 540, 0])):
+def translate_points_away_from_disk(points, disk_normal, disk_center, translation_speed=10):
     """Translates points away from a 3D disk of particles."""
+    disk_center = np.array(disk_center)
     # Normalize the normal vector
     normal_vector = disk_normal / np.linalg.norm(disk_normal)
     # Calculate the distance of each point from the disk plane
@@ -251,35 +300,35 @@ def translate_points_away_from_disk(points, disk_normal, translation_speed=10, d
     points[below_disk] -= normal_vector * translation_speed
     return points
 
-def generate_jet_positions(num_particles, jet_radius, jet_height, center):
+def generate_jet_positions(num_particles, jet_radius, jet_height, center, rng, min_height=100):
     # Generate particle positions along a circular arc around the black hole
     positions = []
     for i in range(num_particles):
         # Calculate x and y coordinates of particle position
-        x, y = rand_point(jet_radius, center[0], center[1])
+        x, y = rand_point(jet_radius, center[0], center[1], rng)
         # Choose random height along the jet
-        z_up = random.uniform(100, jet_height)
-        z_down = random.uniform(-100, -jet_height)
-        z = random.choice([z_up, z_down])
+        z_up = rng.uniform(min_height, jet_height)
+        z_down = rng.uniform(-min_height, -jet_height)
+        z = z_up if rng.random() < 0.5 else z_down
         positions.append([x, y, z])
     
     return np.array(positions)
 
-def generate_new_jet_point(disk_normal, disk_center=(960, 540, 0), radius=20, distance=50):
+def generate_new_jet_point(disk_normal, disk_center, rng, radius=20, distance=50):
     """Creates a point randomly on the disk plane within a given radius from the disk center, and translates it up or down from the disk plane by a given distance."""
     # Generate a random point on the disk plane within the radius from the disk center
-    theta = np.random.uniform(0, 2*np.pi)
-    r = np.random.uniform(0, radius)
+    theta = rng.uniform(0, 2*np.pi)
+    r = rng.uniform(0, radius)
     point_on_disk = np.array([disk_center[0] + r*np.cos(theta), disk_center[1] + r*np.sin(theta), disk_center[2]])
     # Choose randomly whether to translate the point up or down from the disk plane
-    direction = np.random.choice([-1, 1])
+    direction = rng.choice([-1, 1])
     # Calculate the translation vector based on the disk normal and the chosen direction
     translation = direction * distance * np.array(disk_normal)
     # Translate the point along the translation vector
     translated_point = point_on_disk + translation
     return translated_point
 
-def rand_point(radius, x_center, y_center):
+def rand_point(radius, x_center, y_center, rng):
     x_center = x_center
     y_center = y_center
     x_min = x_center - radius
@@ -289,6 +338,6 @@ def rand_point(radius, x_center, y_center):
     radius = radius
     output = [0, 0]
     while True:
-        output[0], output[1] = random.uniform(x_min, x_max), random.uniform(y_min, y_max)
+        output[0], output[1] = rng.uniform(x_min, x_max), rng.uniform(y_min, y_max)
         if math.sqrt(pow(output[0]-x_center,2) + pow(output[1]-y_center,2)) <= radius:
             return output
\ No newline at end of file
@@ -0,0 +1,21 @@
+import numpy as np
+
+def visible_mask(xs, ys, width, height, margin=0, out=None, scratch=None):
+    """
+    Boolean mask of the points whose screen coordinates fall inside the
+    width x height viewport grown by `margin` on every side, so shapes
+    centred just off-screen (e.g. a dot of that radius) still get drawn.
+    Passing preallocated `out` and `scratch` arrays makes it allocation-free.
+    """
+    if out is None:
+        out = np.empty(np.shape(xs), dtype=bool)
+    if scratch is None:
+        scratch = np.empty(np.shape(xs), dtype=bool)
+    np.greater_equal(xs, -margin, out=out)
+    np.less(xs, width + margin, out=scratch)
+    out &= scratch
+    np.greater_equal(ys, -margin, out=scratch)
+    out &= scratch
+    np.less(ys, height + margin, out=scratch)
+    out &= scratch
+    return out
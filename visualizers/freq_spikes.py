@@ -2,6 +2,8 @@ import pygame
 import numpy as np
 from scipy.interpolate import interp1d
 
+from visualizers.surface_cache import SurfaceCache, pixel_view
+
 # Considerations
     # Calculate a bounding rect every frame for local screen updates
     # Figure out how to make a hybrid scale
@@ -14,13 +16,14 @@ class FreqSpikes:
 
     def __init__(self, visualizer):
         self.visualizer = visualizer
+        self.cache = SurfaceCache(visualizer)
+        self.quality_level = 0
         self.update_settings()
         self.initialize_parameters()
 
     def initialize_parameters(self):
         self.heights = np.zeros(self.n_bins, dtype=float)
         self.velocities = np.zeros(self.n_bins, dtype=float)
-        self.mirror_surf = pygame.Surface((self.screen_w, self.half_screen_h))
 
     def update_settings(self):
         self.sensitivity = self.visualizer.settings["volume_sensitivity"]
@@ -28,18 +31,34 @@ class FreqSpikes:
         self.mirror_y = self.visualizer.settings["freq_spikes"]["mirror_y"]
         self.invert_x = self.visualizer.settings["freq_spikes"]["invert_x_mirror"]
         self.invert_y = self.visualizer.settings["freq_spikes"]["invert_y_mirror"]
+        self.stereo = self.visualizer.settings["freq_spikes"]["stereo"]
         self.n_bins = self.visualizer.settings["freq_spikes"]["bins"]
         self.color = self.visualizer.color
         self.screen_w, self.screen_h = self.visualizer.SCREEN_WIDTH, self.visualizer.SCREEN_HEIGHT
+        self.height_scale = self.visualizer.render_scale
         self.half_screen_h = self.screen_h // 2
+        self.quality_levels = [{"bins": max(10, int(self.n_bins * fraction))} for fraction in (1, 0.75, 0.5)]
+        # a reload (e.g. of the sensitivity) keeps whatever level the governor picked
+        self.set_bins(self.quality_levels[min(self.quality_level, len(self.quality_levels) - 1)]["bins"])
+
+    def set_quality(self, level):
+        self.quality_level = level
+        quality = self.quality_levels[min(level, len(self.quality_levels) - 1)]
+        if quality["bins"] != self.heights.shape[-1]:
+            self.set_bins(quality["bins"])
+            self.initialize_parameters()
+
+    def set_bins(self, n_bins):
+        self.n_bins = n_bins
         self.half_n_bins = self.n_bins // 2
         self.bin_width = self.screen_w / self.n_bins
         remaining_space = self.screen_w - (self.bin_width * self.n_bins)        
         self.bin_width += remaining_space / self.n_bins  # Distribute remaining space
 
     def scale_bins(self, raw_amplitudes):
-        n = len(raw_amplitudes)
-        freqs_linear = np.fft.fftfreq(n)[:n//2]
+        # raw_amplitudes is one spectrum, or one per row for stereo
+        n = 2 * (raw_amplitudes.shape[-1] - 1)  # amps is the one-sided spectrum of an n-sample chunk
+        freqs_linear = np.fft.rfftfreq(n)[:n//2]
         
         cutoff_frequency = 220
         normalized_cutoff = cutoff_frequency / self.visualizer.RATE
@@ -68,7 +87,7 @@ class FreqSpikes:
         blended_freqs = np.concatenate([scaled_lower_freqs, scaled_upper_freqs])
 
         # Interpolate to the blended scale
-        interpolate_func = interp1d(freqs_linear, raw_amplitudes[:n//2], kind='linear', fill_value='extrapolate')
+        interpolate_func = interp1d(freqs_linear, raw_amplitudes[..., :n//2], kind='linear', axis=-1, fill_value='extrapolate')
         return blended_freqs, interpolate_func(blended_freqs)
 
     def calculate_heights(self, log_freqs, log_amplitudes):
@@ -76,22 +95,38 @@ class FreqSpikes:
         dampen_factor = 1 - np.exp(-log_freqs / (max(log_freqs) / 200))
         adjusted_amplitudes = np.abs(log_amplitudes * boost_factor * dampen_factor)
         amplitudes = np.multiply(adjusted_amplitudes, 5) ** 1.3
-        target_heights = np.minimum(amplitudes * self.sensitivity, self.MAX_TARGET_HEIGHT * 5) / 5
-        target_heights = target_heights[:self.n_bins]
+        target_heights = np.minimum(amplitudes * self.sensitivity, self.MAX_TARGET_HEIGHT * 5) / 5 * self.height_scale
+        target_heights = target_heights[..., :self.n_bins]
+        if self.heights.shape != target_heights.shape:  # switched between mono and stereo input
+            self.heights = np.zeros(target_heights.shape)
         self.heights = self.DECAY_FACTOR * self.heights + (1 - self.DECAY_FACTOR) * target_heights
 
     def update(self, audio_features):
-        raw_amplitudes = np.array(audio_features["amps"])
+        if self.stereo and "channel_amps" in audio_features:
+            # left and right get their own rows of heights
+            raw_amplitudes = np.asarray(audio_features["channel_amps"][:2])
+        else:
+            raw_amplitudes = np.array(audio_features["amps"])
         log_freqs, log_amplitudes = self.scale_bins(raw_amplitudes)
         self.calculate_heights(log_freqs, log_amplitudes)
 
+    def is_settled(self):
+        # every spike has decayed below a pixel
+        return not np.any(self.heights >= 1)
+
     def get_mirrored_heights(self):
+        if self.heights.ndim == 2:
+            # stereo: the left channel fills the left half and the right channel the right half
+            left = self.heights[0][:self.heights.shape[1]//2]
+            right = self.heights[1][:self.heights.shape[1]//2]
+            return np.concatenate([left[::-1], right]) if self.invert_x else np.concatenate([left, right[::-1]])
         first_half = self.heights[:len(self.heights)//2]
         mirrored_half = first_half[::-1]
         return np.concatenate([mirrored_half, first_half]) if self.invert_x else np.concatenate([first_half, mirrored_half])
 
     def draw_spikes(self, screen, w):
-        heights = self.heights if not self.mirror_x else self.get_mirrored_heights()
+        # stereo heights are always laid out left/right like the mirrored view
+        heights = self.heights if not (self.mirror_x or self.heights.ndim == 2) else self.get_mirrored_heights()
         for i, h in enumerate(heights):
             x = int(i * self.bin_width + w)
             if h > 0:
@@ -100,15 +135,19 @@ class FreqSpikes:
                 pygame.draw.polygon(screen, self.visualizer.color, [(x - w, self.screen_h), (x, self.screen_h - h), (x + w, self.screen_h)])
 
     def draw_mirrored_view(self, screen):
-        mirrored_snapshot = pygame.transform.flip(screen, self.invert_y, True)
-        self.mirror_surf.blit(mirrored_snapshot, (0, 0))
-        screen.blit(self.mirror_surf, (0, 0))
+        # copies the bottom half upside down into the top half in place, instead of flipping a full-screen copy
+        pixels = pixel_view(screen)
+        bottom = pixels[:, self.screen_h - 1:self.screen_h - 1 - self.half_screen_h:-1]
+        pixels[:, :self.half_screen_h] = bottom[::-1] if self.invert_y else bottom
+        del pixels  # unlocks the surface
 
     def draw(self):
         screen = self.visualizer.screen
         w = self.bin_width // 2
-        pygame.draw.rect(screen, (0, 0, 0), (0, self.screen_h-6, self.screen_w, 5))
+        color = tuple(self.visualizer.color)
+        # the baselines are prerendered, the coloured one again only when the colour changes
+        self.cache.blit("shadow", (0, self.screen_h-6), (self.screen_w, 5), None, lambda surface: surface.fill((0, 0, 0)))
         self.draw_spikes(screen, w)
-        pygame.draw.rect(screen, self.visualizer.color, (0, self.screen_h-3, self.screen_w, 5))
+        self.cache.blit("baseline", (0, self.screen_h-3), (self.screen_w, 3), color, lambda surface: surface.fill(color))
         if self.mirror_y:
             self.draw_mirrored_view(screen)
@@ -0,0 +1,59 @@
+import numpy as np
+
+# the 12 edge-midpoint gradients of improved Perlin noise
+GRADIENTS = np.array([
+    [1, 1, 0], [-1, 1, 0], [1, -1, 0], [-1, -1, 0],
+    [1, 0, 1], [-1, 0, 1], [1, 0, -1], [-1, 0, -1],
+    [0, 1, 1], [0, -1, 1], [0, 1, -1], [0, -1, -1]
+], dtype=float)
+
+class GradientNoise:
+    """
+    3D gradient (Perlin) noise evaluated over whole NumPy arrays of sample
+    points per call, in roughly [-1, 1] like noise.pnoise3.
+    """
+    def __init__(self, seed=None):
+        perm = np.random.default_rng(seed).permutation(256)
+        # doubled so the lattice hashes below never need to wrap
+        self.perm = np.concatenate([perm, perm])
+        # gradient for the hash stored at each position, so a corner lookup is a single gather
+        self.perm_gradients = GRADIENTS[self.perm % 12]
+
+    def noise3(self, x, y, z):
+        x, y, z = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(z, dtype=float))
+        xf, yf, zf = np.floor(x), np.floor(y), np.floor(z)
+        xi = xf.astype(int) & 255
+        yi = yf.astype(int) & 255
+        zi = zf.astype(int) & 255
+        x = x - xf
+        y = y - yf
+        z = z - zf
+        u, v, w = fade(x), fade(y), fade(z)
+
+        # hash the 8 surrounding lattice corners
+        p = self.perm
+        a = p[xi] + yi
+        b = p[xi + 1] + yi
+        aa = p[a] + zi
+        ab = p[a + 1] + zi
+        ba = p[b] + zi
+        bb = p[b + 1] + zi
+
+        x1 = lerp(u, self.grad(aa, x, y, z), self.grad(ba, x - 1, y, z))
+        x2 = lerp(u, self.grad(ab, x, y - 1, z), self.grad(bb, x - 1, y - 1, z))
+        y1 = lerp(v, x1, x2)
+        x1 = lerp(u, self.grad(aa + 1, x, y, z - 1), self.grad(ba + 1, x - 1, y, z - 1))
+        x2 = lerp(u, self.grad(ab + 1, x, y - 1, z - 1), self.grad(bb + 1, x - 1, y - 1, z - 1))
+        y2 = lerp(v, x1, x2)
+        return lerp(w, y1, y2)
+
+    def grad(self, index, x, y, z):
+        g = self.perm_gradients[index]
+        return g[..., 0] * x + g[..., 1] * y + g[..., 2] * z
+
+
+def fade(t):
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+def lerp(t, a, b):
+    return a + t * (b - a)
@@ -2,11 +2,13 @@ import math
 import pygame
 import numpy as np
 import colorsys
+from visualizers.culling import visible_mask
 
 # add frequency bar at bottom or sides to generate waves completely based on music
 
 PAN_SPEED = 20
 ZOOM_FACTOR = 1.1
+DOT_RADIUS = 2
 
 class Camera:
     def __init__(self, particle_field, x=0, y=0, zoom=1, angle=0):
@@ -20,19 +22,13 @@ class Camera:
         self.update()
         self.zoom_out(1 + particle_field.zoom_factor/10)
 
-    def transform_points(self, points):
-        # Add a homogeneous coordinate of 1
-        homogeneous_coord = np.ones((points.shape[0], points.shape[1], 1))
-        particles_with_homogeneous = np.concatenate((points[:, :, :2], homogeneous_coord), axis=2)
-        
-        # Reshape the particles to a 2D array and then transpose it to a 3xN array
-        particles_reshaped = particles_with_homogeneous.reshape(-1, 3).T
-
-        # Apply the transformation
-        transformed_particles = np.dot(self.transformation_matrix, particles_reshaped)
-
-        # Reshape back to the original shape and return
-        return transformed_particles.T.reshape(self.particle_field.grid_w, self.particle_field.grid_h, 3)
+    def transform_points(self, points, out):
+        # Pan and zoom only, so transformation_matrix reduces to a scale plus an offset applied in place
+        np.multiply(points[:, :, 0], self.zoom, out=out[:, :, 0])
+        out[:, :, 0] += self.x
+        np.multiply(points[:, :, 1], self.zoom, out=out[:, :, 1])
+        out[:, :, 1] += self.y
+        return out
 
     def update(self):
         '''
@@ -112,11 +108,15 @@ class ParticleField:
         self.screen_w = visualizer.SCREEN_WIDTH
         self.screen_h = visualizer.SCREEN_HEIGHT
         self.debug = False
+        self.rng = visualizer.make_rng("particle_field")
+        self.state = None  # DoubleBuffer when a SimulationPipeline runs update() on another thread
         self.update_settings()
         self.camera = Camera(self)
+        self.active_grid_size = self.grid_size
         self.init_field(48*self.grid_size, 27*self.grid_size)
         self.precompute_velocity_colors()
         self.setup_external_forces()
+        self.build_quality_levels()
 
     def init_field(self, grid_w=48, grid_h=27):  # 64, 36
         self.grid_w = grid_w
@@ -124,19 +124,37 @@ class ParticleField:
         
         # Initialize particles with positions and velocities
         # Each particle is represented as [x, y, z, vx, vy, vz]
-        self.particles = np.zeros((self.grid_w, self.grid_h, 6))
-        self.transformed_points = np.zeros((self.grid_w, self.grid_h, 3))
+        self.particles = np.zeros((self.grid_w, self.grid_h, 6), dtype=np.float32)
+        self.positions = self.particles[:, :, 0:3]
+        self.velocities = self.particles[:, :, 3:6]
 
         dx = self.screen_w // self.grid_w
         dy = self.screen_h // self.grid_h
-        for i in range(self.grid_w):
-            for j in range(self.grid_h):
-                x = i * dx + dx // 2
-                y = j * dy + dy // 2
-                z = 0
-                vx, vy, vz = 0, 0, 0  # Initial velocities
-                self.particles[i, j] = np.array([x, y, z, vx, vy, vz])
-        self.original_positions = np.copy(self.particles)
+        self.particles[:, :, 0] = (np.arange(self.grid_w) * dx + dx // 2)[:, np.newaxis]
+        self.particles[:, :, 1] = (np.arange(self.grid_h) * dy + dy // 2)[np.newaxis, :]
+        self.original_positions = np.copy(self.positions)
+        self.allocate_work_buffers()
+
+    def allocate_work_buffers(self):
+        # Every per-frame intermediate lives here and is overwritten in place,
+        # so a simulation step allocates (almost) nothing regardless of grid size
+        grid = (self.grid_w, self.grid_h)
+        self.forces = np.zeros(grid + (3,), dtype=np.float32)
+        self.displacement = np.zeros(grid + (3,), dtype=np.float32)
+        self.neighbor_mean = np.zeros((self.grid_w - 2, self.grid_h - 2, 3), dtype=np.float32)
+        self.radial_forces = np.zeros(grid + (3,), dtype=np.float32)
+        self.wave_dx = np.zeros(grid, dtype=np.float32)
+        self.wave_dy = np.zeros(grid, dtype=np.float32)
+        self.wave_distance = np.zeros(grid, dtype=np.float32)
+        self.wave_profile = np.zeros(grid, dtype=np.float32)
+        self.velocity_squared = np.zeros(grid + (3,), dtype=np.float32)
+        self.speeds = np.zeros(grid, dtype=np.float32)
+        self.speed_indices = np.zeros(grid, dtype=np.intp)
+        self.particle_colors = np.zeros(grid + (3,), dtype=np.uint8)
+        self.transformed_points = np.zeros(grid + (2,), dtype=np.float32)
+        self.distortion = np.zeros(grid + (2,), dtype=np.float32)
+        self.visible = np.zeros(self.grid_w * self.grid_h, dtype=bool)
+        self.visible_scratch = np.zeros(self.grid_w * self.grid_h, dtype=bool)
 
     def precompute_velocity_colors(self):
         max_velocity = 80  # This is the maximum expected velocity
@@ -150,12 +168,21 @@ class ParticleField:
                 saturation = 1.0
             hue = normalized_magnitude * 360
             self.color_map[v] = [int(x * 255) for x in colorsys.hsv_to_rgb(hue / 360.0, saturation, 1.0)]
-        self.velocity_magnitudes = np.linalg.norm(self.particles[:,:,3:6], axis=2).astype(int)
-        self.particle_colors = np.array([self.color_map.get(mag, self.color_map[50]) for mag in self.velocity_magnitudes.flatten()]).reshape(self.grid_w, self.grid_h, 3)
+        # one extra entry: speeds past max_velocity use the colour for 50
+        self.color_lut = np.array([self.color_map[v] for v in range(max_velocity + 1)] + [self.color_map[50]], dtype=np.uint8)
+        self.update_particle_colors()
+
+    def update_particle_colors(self):
+        np.multiply(self.velocities, self.velocities, out=self.velocity_squared)
+        np.sum(self.velocity_squared, axis=2, out=self.speeds)
+        np.sqrt(self.speeds, out=self.speeds)
+        np.minimum(self.speeds, len(self.color_lut) - 1, out=self.speeds)
+        self.speed_indices[...] = self.speeds  # truncates like astype(int)
+        np.take(self.color_lut, self.speed_indices, axis=0, out=self.particle_colors, mode='clip')
 
     def setup_external_forces(self):
         # Edge waves
-        self.edge_force = np.zeros((self.grid_w, self.grid_h, 3))
+        self.edge_force = np.zeros((self.grid_w, self.grid_h, 3), dtype=np.float32)
         self.wave_damping_factor = 0.6  # How much the wave dampens after each bounce
         self.wave_threshold = 18
         self.wave_speed = 1
@@ -183,6 +210,30 @@ class ParticleField:
         self.edge_waves = self.visualizer.settings["particle_field"]["edge_waves"]
         self.radial_waves = self.visualizer.settings["particle_field"]["radial_waves"]
 
+    def build_quality_levels(self):
+        self.quality_levels = [
+            {"grid_size": self.grid_size, "sampling_rate": 10},
+            {"grid_size": self.grid_size, "sampling_rate": 15}
+        ]
+        for grid_size in range(self.grid_size - 1, 0, -1):
+            self.quality_levels.append({"grid_size": grid_size, "sampling_rate": 20})
+
+    def set_quality(self, level):
+        quality = self.quality_levels[min(level, len(self.quality_levels) - 1)]
+        if quality["grid_size"] != self.active_grid_size:
+            # a new grid restarts the simulation from rest
+            self.active_grid_size = quality["grid_size"]
+            self.init_field(48*self.active_grid_size, 27*self.active_grid_size)
+            self.precompute_velocity_colors()
+            self.setup_external_forces()
+        self.sampling_rate = quality["sampling_rate"]
+
+    def is_settled(self):
+        # at rest, with no jitter and no wave left that could still push a particle
+        return (not self.wavefronts and self.distortion_factor < 1
+                and not any(wavefront['magnitude'] for wavefront in self.persistent_radial_wavefronts)
+                and np.abs(self.velocities).max() < 0.01)
+
     def check_user_input(self):
         pressed_keys = pygame.key.get_pressed()
 
@@ -210,71 +261,82 @@ class ParticleField:
 
     def update(self, audio_features):
         self.check_user_input()
+        self.simulate(audio_features)
+
+    def simulate(self, audio_features):
         amplitude_data = audio_features["amps"]
         magnitude = np.max(amplitude_data)
 
         # Update velocities based on forces
-        internal_forces = self.process_internal_forces()
-        external_forces = self.process_external_forces(magnitude, audio_features["fft"])
-        total_forces = internal_forces + external_forces
-        self.particles[:,:,3:6] += total_forces
+        total_forces = self.process_internal_forces()
+        total_forces += self.process_external_forces(magnitude, audio_features["fft"])
+        self.velocities += total_forces
 
         # Update positions based on velocities
-        self.particles[:,:,0:3] += self.particles[:,:,3:6]
-        self.velocity_magnitudes = np.linalg.norm(self.particles[:,:,3:6], axis=2).astype(int)
-        self.particle_colors = np.array([self.color_map.get(mag, self.color_map[50]) for mag in self.velocity_magnitudes.flatten()]).reshape(self.grid_w, self.grid_h, 3)
-        self.transformed_points = self.camera.transform_points(self.particles)
+        self.positions += self.velocities
+        self.update_particle_colors()
+        self.camera.transform_points(self.positions, self.transformed_points)
 
         # Generate random distortion values
         if self.distortion_factor >= 1:
-            df = self.distortion_factor
-            x_distort = np.random.randint(-df, df, self.transformed_points[:,:,0:1].shape)
-            y_distort = np.random.randint(-df, df, self.transformed_points[:,:,1:2].shape)
-            self.transformed_points[:,:,0:1] += x_distort
-            self.transformed_points[:,:,1:2] += y_distort
+            # integers in [-df, df) like np.random.randint(-df, df), drawn into the reused buffer
+            low, high = int(-self.distortion_factor), int(self.distortion_factor)
+            self.rng.random(dtype=np.float32, out=self.distortion)
+            self.distortion *= high - low
+            np.floor(self.distortion, out=self.distortion)
+            self.distortion += low
+            self.transformed_points += self.distortion
 
     def process_internal_forces(self):
-        damping_factor = 0.95
-        self.particles[:,:,3:6] *= damping_factor
+        positions = self.positions
+        forces = self.forces
+        displacement = self.displacement
 
-        internal_forces = -0.01 * (self.particles[:,:,0:3] - self.original_positions[:,:,0:3])
+        damping_factor = 0.95
+        self.velocities *= damping_factor
 
-        neighbor_forces = (
-            np.roll(self.particles[:,:,0:3], shift=-1, axis=0) +
-            np.roll(self.particles[:,:,0:3], shift=1, axis=0) +
-            np.roll(self.particles[:,:,0:3], shift=-1, axis=1) +
-            np.roll(self.particles[:,:,0:3], shift=1, axis=1)
-        ) / 4.0
+        np.subtract(positions, self.original_positions, out=displacement)
+        np.multiply(displacement, -0.01, out=forces)
 
-        internal_forces[1:-1, 1:-1, 0:3] += 0.05 * (neighbor_forces[1:-1, 1:-1, 0:3] - self.particles[1:-1, 1:-1, 0:3])
+        # Mean of the 4 grid neighbours, only interior particles feel it
+        neighbor_mean = self.neighbor_mean
+        np.add(positions[2:, 1:-1], positions[:-2, 1:-1], out=neighbor_mean)
+        neighbor_mean += positions[1:-1, 2:]
+        neighbor_mean += positions[1:-1, :-2]
+        neighbor_mean *= 0.25
+        neighbor_mean -= positions[1:-1, 1:-1]
+        neighbor_mean *= 0.05
+        forces[1:-1, 1:-1] += neighbor_mean
 
         # Dampen the internal forces a bit
-        internal_forces *= 0.3
+        forces *= 0.3
 
         # Add restoring forces to pull particles back to their original positions
-        restoring_force = -0.1 * (self.particles[:,:,0:2] - self.original_positions[:,:,0:2])
-        internal_forces[:,:,0:2] += restoring_force
+        displacement[:, :, 0:2] *= 0.1
+        forces[:, :, 0:2] -= displacement[:, :, 0:2]
 
-        return internal_forces
+        return forces
 
     def process_external_forces(self, magnitude, fft_data):
-        if magnitude >= self.wave_threshold  and np.random.random() < 0.3:
+        if magnitude >= self.wave_threshold  and self.rng.random() < 0.3:
             if self.edge_waves:
-                wave_direction = np.random.choice(['up', 'down', 'left', 'right'])
+                wave_direction = self.rng.choice(['up', 'down', 'left', 'right'])
                 self.generate_edge_wavefront(magnitude, wave_direction)
   
         # check distortion
         if magnitude > self.distortion_threshold:
             if self.distortion_factor < 5:  # hard cap
                 self.distortion_factor += magnitude / 5
-        elif self.distortion_factor > 1:
-            self.distortion_factor -= 0.5
+        elif self.distortion_factor >= 1:
+            # down to below 1, where the field stops jittering and can settle
+            self.distortion_factor = max(0.0, self.distortion_factor - 0.5)
 
         self.update_edge_wavefronts()
-        radial_forces = self.update_radial_wavefronts(fft_data, magnitude)
+        external_forces = self.update_radial_wavefronts(fft_data, magnitude)
 
         #return np.zeros((self.grid_w, self.grid_h, 3))
-        return radial_forces + self.edge_force
+        external_forces += self.edge_force
+        return external_forces
 
     def generate_edge_wavefront(self, magnitude, wave_direction='up'):
         self.wavefronts.append({
@@ -317,13 +379,18 @@ class ParticleField:
 
     def generate_radial_wavefront(self, center_x, center_y, magnitude):
         mg = np.real(magnitude)
+        scale = self.visualizer.render_scale
         new_wavefront = {'center_x': center_x, 'center_y': center_y,
                         'radius': 0, 'magnitude': mg*2,
-                        'speed': 10+mg*2, 'max_radius': 1200}
+                        'speed': (10+mg*2) * scale, 'max_radius': 1200 * scale}
         self.persistent_radial_wavefronts.append(new_wavefront) 
 
     def update_radial_wavefronts(self, fft_data, magnitude):
-        force_vectors = np.zeros((self.grid_w, self.grid_h, 3), dtype=float)
+        force_vectors = self.radial_forces
+        force_vectors.fill(0)
+        dx, dy = self.wave_dx, self.wave_dy
+        distance, profile = self.wave_distance, self.wave_profile
+        gaussian_width = 30.0 * self.visualizer.render_scale
 
         # Generate new wavefronts based on the current force centers
         if self.radial_waves:
@@ -343,26 +410,27 @@ class ParticleField:
             if self.debug:
                 pygame.draw.circle(self.visualizer.screen, (255,0,0), (center_x, center_y), radius, 2)
 
-            dx = self.particles[:,:,0] - center_x
-            dy = self.particles[:,:,1] - center_y
-            distance = np.sqrt(dx ** 2 + dy ** 2)
+            np.subtract(self.positions[:, :, 0], center_x, out=dx)
+            np.subtract(self.positions[:, :, 1], center_y, out=dy)
+            np.hypot(dx, dy, out=distance)
 
             # Gaussian profile for the force
-            gaussian_width = 30.0
-            gaussian_profile = np.exp(-((distance - radius)**2) / (2*gaussian_width**2))
+            np.subtract(distance, radius, out=profile)
+            np.square(profile, out=profile)
+            profile *= -1 / (2*gaussian_width**2)
+            np.exp(profile, out=profile)
 
             # Apply radial force only to particles close to the current wavefront radius
-            radial_force = wavefront['magnitude']
-
-            angles = np.arctan2(dy, dx)
-            cos_angles = np.cos(angles)
-            sin_angles = np.sin(angles)
-
-            force_update_x = gaussian_profile * radial_force * cos_angles
-            force_update_y = gaussian_profile * radial_force * sin_angles
+            profile *= wavefront['magnitude']
 
-            np.add(force_vectors[:, :, 0], force_update_x, out=force_vectors[:, :, 0])
-            np.add(force_vectors[:, :, 1], force_update_y, out=force_vectors[:, :, 1])
+            # cos and sin of the angle to the centre are dx/distance and dy/distance;
+            # a particle exactly on the centre gets no push
+            np.maximum(distance, 1e-6, out=distance)
+            np.divide(profile, distance, out=profile)
+            dx *= profile
+            dy *= profile
+            force_vectors[:, :, 0] += dx
+            force_vectors[:, :, 1] += dy
 
             # Update radius for next frame
             wavefront['radius'] += wavefront['speed']
@@ -378,12 +446,24 @@ class ParticleField:
 
         return force_vectors
 
+    def publish_state(self):
+        self.state.write("points", self.transformed_points.reshape(-1, 2))
+        self.state.write("colors", self.particle_colors.reshape(-1, 3))
+
+    def render_state(self):
+        if self.state is not None:
+            return self.state.read("points"), self.state.read("colors")
+        return self.transformed_points.reshape(-1, 2), self.particle_colors.reshape(-1, 3)
+
     def draw(self):
-        for i in range(self.grid_w):
-            for j in range(self.grid_h):
-                x, y, w = self.transformed_points[i, j]
-                r, g, b = self.particle_colors[i, j]
-                pygame.draw.circle(self.visualizer.screen, (r, g, b), (x, y), 2)
+        screen = self.visualizer.screen
+        points, colors = self.render_state()
+        # the published state lags a grid resize by a frame, so the mask buffers may not fit it yet
+        buffers = (self.visible, self.visible_scratch) if len(points) == len(self.visible) else (None, None)
+        # only particles the camera keeps on screen are drawn, so zooming in makes frames cheaper
+        visible = visible_mask(points[:, 0], points[:, 1], self.screen_w, self.screen_h, DOT_RADIUS, *buffers)
+        for point, color in zip(points[visible].tolist(), colors[visible].tolist()):
+            pygame.draw.circle(screen, color, point, DOT_RADIUS)
 
     def debug_draw(self, i, j, x, y):
         # Draw velocity vectors (scaled down for visibility)
@@ -1,19 +1,49 @@
 import pygame
-import noise
+import numpy as np
+from visualizers.gradient_noise import GradientNoise
 
 class PerlinField:
     def __init__(self, visualizer):
         self.visualizer = visualizer
-        self.p3count = 1
+        self.noise = GradientNoise(visualizer.make_rng("perlinfield"))
         self.nonce = 0
+        self.rows = 0
+        self.quality_level = 0
+        self.update_settings()
 
-    def update(self, pitch, volume):
+    def update_settings(self):
+        self.configured_rows = self.visualizer.settings["perlinfield"]["max_rows"]
+        self.quality_levels = [{"max_rows": max(1, int(self.configured_rows * fraction))} for fraction in (1, 0.75, 0.5)]
+        # a reload (e.g. of the sensitivity) keeps whatever level the governor picked
+        self.set_quality(self.quality_level)
+        self.x_step = self.visualizer.settings["perlinfield"]["x_step"]
+        self.screen_w, self.screen_h = self.visualizer.SCREEN_WIDTH, self.visualizer.SCREEN_HEIGHT
+        scale = self.visualizer.render_scale
+        # the field's baseline sits at the same fraction of the height on any screen, layer or display region
+        self.offset = self.screen_h * 500 / 1080
+
+        # noise coordinates are in display pixels, so the field looks the same at any render_scale
+        xs = np.arange(0, self.screen_w, self.x_step)
+        self.sample_x = xs[np.newaxis, :] * (0.002 / scale)
+        self.sample_y = np.arange(self.configured_rows)[:, np.newaxis] * 0.02
+
+        # (row, column, xy) points handed to pygame.draw.lines, x never changes
+        self.points = np.zeros((self.configured_rows, len(xs), 2))
+        self.points[:, :, 0] = xs
+
+    def set_quality(self, level):
+        self.quality_level = level
+        self.max_rows = self.quality_levels[min(level, len(self.quality_levels) - 1)]["max_rows"]
+
+    def update(self, audio_features):
+        volume = np.max(audio_features["amps"])
         self.nonce += (volume//2)+1
-        self.p3count = volume
-        for y in range(0, self.p3count):
-            for x in range(0, self.visualizer.SCREEN_WIDTH):
-                drawHeight = self.visualizer.SCREEN_HEIGHT - noise.pnoise3(x*0.002, y*0.02, self.nonce*0.02) * self.visualizer.SCREEN_HEIGHT - 500
-                pygame.draw.line(self.visualizer.screen, self.visualizer.color, (x,drawHeight), (x,drawHeight), width=5)
+        self.rows = min(int(volume), self.max_rows)
+        if self.rows:
+            # one noise call for every sample of every row
+            heights = self.noise.noise3(self.sample_x, self.sample_y[:self.rows], self.nonce*0.02)
+            self.points[:self.rows, :, 1] = self.screen_h - heights * self.screen_h - self.offset
 
     def draw(self):
-        pass
+        for row in self.points[:self.rows]:
+            pygame.draw.lines(self.visualizer.screen, self.visualizer.color, False, row.tolist(), width=5)
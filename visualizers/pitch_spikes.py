@@ -1,34 +1,46 @@
 import pygame
 import numpy as np
+from bisect import bisect_left
+
+from visualizers.surface_cache import SurfaceCache
 
 class PitchSpikes:
     MAX_TARGET_HEIGHT = 400
     DECAY_FACTOR = 0.75  # Moved decay factor here to align with FreqSpikes
     LOG_BIN_SCALING_FACTOR = 1.5  # Similar to FreqSpikes
+    MAX_PITCH = 4000
 
     def __init__(self, visualizer):
         self.visualizer = visualizer
-        self.update_settings()
-        self.spikes = np.zeros(self.n_bins, dtype=float)
-        self.velocities = np.zeros(self.n_bins, dtype=float)
+        self.cache = SurfaceCache(visualizer)
         self.decay_factor = 0.6
-        self.screen_w, self.screen_h = visualizer.SCREEN_WIDTH, visualizer.SCREEN_HEIGHT
-        self.bin_width = self.screen_w / self.n_bins
-        self.half_screen_h = self.screen_h // 2
+        self.n_bins = None
+        self.update_settings()
 
     def update_settings(self):
         self.sensitivity = self.visualizer.settings["volume_sensitivity"]
-        self.n_bins = self.visualizer.settings["pitch_spikes"]["bins"]
+        self.screen_w, self.screen_h = self.visualizer.SCREEN_WIDTH, self.visualizer.SCREEN_HEIGHT
+        self.half_screen_h = self.screen_h // 2
+        self.height_scale = self.visualizer.render_scale
+        # spikes are shifted left by a width tuned on a 1920 px wide screen
+        self.x_offset = 250 * self.LOG_BIN_SCALING_FACTOR * self.screen_w / 1920
+        n_bins = self.visualizer.settings["pitch_spikes"]["bins"]
+        if n_bins != self.n_bins:
+            self.set_bins(n_bins)
 
-    def scale_bins(self, pitch):
-        n = 4000  # max pitch
-        pitch_linear = np.linspace(0, n, n+1)
+    def set_bins(self, n_bins):
+        self.n_bins = n_bins
+        self.spikes = np.zeros(self.n_bins, dtype=float)
+        self.velocities = np.zeros(self.n_bins, dtype=float)
+        self.bin_width = self.screen_w / self.n_bins
+        self.scale_bins()
 
+    def scale_bins(self):
         # Create more bins for lower pitches
-        more_bins_for_low_pitch = np.logspace(np.log10(pitch_linear[1]), np.log10(pitch_linear[-1]), int(self.n_bins * self.LOG_BIN_SCALING_FACTOR))
-        log_pitches = more_bins_for_low_pitch[:self.n_bins]  # take only the required number of bins
-
-        return log_pitches
+        more_bins_for_low_pitch = np.logspace(0, np.log10(self.MAX_PITCH), int(self.n_bins * self.LOG_BIN_SCALING_FACTOR))
+        self.log_pitches = more_bins_for_low_pitch[:self.n_bins]  # take only the required number of bins
+        # a pitch belongs to the bin whose centre is nearest, so bisecting the midpoints finds it
+        self.bin_edges = ((self.log_pitches[:-1] + self.log_pitches[1:]) / 2).tolist()
 
     def update(self, audio_features):
         # Apply decay to all spikes first
@@ -36,17 +48,20 @@ class PitchSpikes:
 
         # Update spike based on pitch
         pitch = audio_features["pitch"]
-        log_pitches = self.scale_bins(pitch)
-        bin_index = (np.abs(log_pitches - pitch)).argmin()
+        bin_index = bisect_left(self.bin_edges, pitch)
         volume = (np.max(audio_features["amps"])) * 50
         if 0 <= bin_index < self.n_bins:
-            target_height = min(volume * self.sensitivity, self.MAX_TARGET_HEIGHT)
+            target_height = min(volume * self.sensitivity, self.MAX_TARGET_HEIGHT) * self.height_scale
             self.spikes[bin_index] = self.DECAY_FACTOR * self.spikes[bin_index] + (1 - self.DECAY_FACTOR) * target_height
 
+    def is_settled(self):
+        # every spike has decayed below a pixel
+        return not np.any(self.spikes >= 1)
+
     def draw_spikes(self, screen):
         w = self.bin_width // 2
+        offset = self.x_offset
         for i, h in enumerate(self.spikes):
-            offset = 250 * self.LOG_BIN_SCALING_FACTOR
             x = int(i * self.bin_width + w) - offset
             if h > 0 and x != - offset:
                 pygame.draw.polygon(screen, (0, 0, 0), [(x - w-3, self.screen_h), (x, self.screen_h - h-3), (x + w+3, self.screen_h)])
@@ -54,6 +69,8 @@ class PitchSpikes:
 
     def draw(self):
         screen = self.visualizer.screen
-        pygame.draw.rect(screen, (0, 0, 0), (0, self.screen_h-6, self.screen_w, 5))
+        color = tuple(self.visualizer.color)
+        # the baselines are prerendered, the coloured one again only when the colour changes
+        self.cache.blit("shadow", (0, self.screen_h-6), (self.screen_w, 5), None, lambda surface: surface.fill((0, 0, 0)))
         self.draw_spikes(screen)
-        pygame.draw.rect(screen, self.visualizer.color, (0, self.screen_h-3, self.screen_w, 5))
+        self.cache.blit("baseline", (0, self.screen_h-3), (self.screen_w, 3), color, lambda surface: surface.fill(color))
@@ -1,16 +1,24 @@
 import pygame
-from random import randint
 import numpy as np
 
 class Soundwaves:
+    consumes_sequence = True  # every chunk of a backlog spawns its own ring
+
     def __init__(self, visualizer):
         self.soundwaves = []
         self.visualizer = visualizer
+        self.rng = visualizer.make_rng("soundwaves")
         self.position = "center"
+        self.quality_levels = [{"max_soundwaves": cap} for cap in (400, 200, 100, 50)]
+        self.max_soundwaves = 400
 
     def update_settings(self):
         pass
 
+    def set_quality(self, level):
+        quality = self.quality_levels[min(level, len(self.quality_levels) - 1)]
+        self.max_soundwaves = quality["max_soundwaves"]
+
     def update(self, audio_features):
         volume = np.max(audio_features["amps"]) ** 1.3
         color = self.visualizer.color
@@ -22,10 +30,18 @@ class Soundwaves:
 
         if volume >= 0:
             if self.position == 'random':
-                self.soundwaves.append(Soundwave(self.visualizer, randint(0,self.visualizer.SCREEN_WIDTH), randint(0,self.visualizer.SCREEN_HEIGHT), volume, color))
+                self.soundwaves.append(Soundwave(self.visualizer, self.rng.integers(0, self.visualizer.SCREEN_WIDTH, endpoint=True), self.rng.integers(0, self.visualizer.SCREEN_HEIGHT, endpoint=True), volume, color))
             elif self.position == 'center':
                 self.soundwaves.append(Soundwave(self.visualizer, self.visualizer.SCREEN_WIDTH//2, self.visualizer.SCREEN_HEIGHT//2, volume, color))
 
+        # drop the oldest rings once over the live cap
+        if len(self.soundwaves) > self.max_soundwaves:
+            del self.soundwaves[:len(self.soundwaves) - self.max_soundwaves]
+
+    def is_settled(self):
+        # silence only spawns rings that never grow
+        return all(soundwave.maxRadius < 1 for soundwave in self.soundwaves)
+
     def draw(self):
         for soundwave in self.soundwaves:
             soundwave.draw()
@@ -35,8 +51,8 @@ class Soundwave:
         self.visualizer = visualizer
         self.x = x
         self.y = y
-        self.speed = volume
-        self.maxRadius = volume * self.visualizer.settings["volume_sensitivity"]
+        self.speed = volume * self.visualizer.render_scale
+        self.maxRadius = self.speed * self.visualizer.settings["volume_sensitivity"]
         self.radius = 0
         self.done = False
         self.color = color
@@ -0,0 +1,104 @@
+import pygame
+import numpy as np
+
+class Spectrogram:
+    """
+    Scrolling waterfall of the spectrum. Each chunk writes one column into a
+    circular 8-bit image at the write head and the image is blitted in two
+    pieces split at the head, so nothing is ever shifted and the cost per
+    frame doesn't depend on the history length. Pixel values index a
+    palette, which recolours the whole history at no cost when the colour
+    changes. Index 0 is the colour key, so quiet bins stay transparent.
+    """
+    consumes_sequence = True  # every chunk of a backlog gets its own column
+    FLOOR_DB = -10
+    RANGE_DB = 50
+
+    def __init__(self, visualizer):
+        self.visualizer = visualizer
+        self.update_settings()
+
+    def update_settings(self):
+        settings = self.visualizer.settings["spectrogram"]
+        self.sensitivity = self.visualizer.settings["volume_sensitivity"]
+        self.scale = settings["scale"]
+        screen_w, screen_h = self.visualizer.SCREEN_WIDTH, self.visualizer.SCREEN_HEIGHT
+
+        # a column is as many pixels wide as it takes for `history` of them to span the screen
+        self.column_w = max(1, screen_w // settings["history"])
+        self.columns = screen_w // self.column_w
+        self.buffer_w = self.columns * self.column_w
+        self.buffer_h = max(1, round(screen_h * settings["height"]))
+        y = {"top": 0, "center": (screen_h - self.buffer_h) // 2}.get(settings["placement"], screen_h - self.buffer_h)
+        self.position = (screen_w - self.buffer_w, y)
+
+        self.buffer = pygame.Surface((self.buffer_w, self.buffer_h), 0, 8)
+        self.buffer.set_palette_at(0, self.visualizer.fuchsia)
+        self.buffer.fill(0)
+        self.buffer.set_colorkey(self.visualizer.fuchsia)
+        self.palette_color = None
+        self.head = 0  # next column to write, the oldest one on screen
+        self.silent_columns = self.columns
+
+        self.n_bins = None
+        self.levels = np.zeros(self.buffer_h, dtype=np.float32)
+        self.column = np.zeros(self.buffer_h, dtype=np.uint8)
+
+    def map_rows(self, n_bins):
+        # the spectrum bin shown on each row, highest frequency on top and DC left out
+        self.n_bins = n_bins
+        if self.scale == "log":
+            bins = np.geomspace(1, n_bins - 1, self.buffer_h)
+        else:
+            bins = np.linspace(1, n_bins - 1, self.buffer_h)
+        self.row_bins = np.round(bins[::-1]).astype(np.intp)
+
+    def update_palette(self, color):
+        # index 0 stays the colour key, 1..255 ramp from black through the colour to white
+        self.palette_color = color
+        t = np.linspace(0, 1, 255)[:, np.newaxis]
+        color = np.asarray(color, dtype=float)
+        low = np.minimum(t * 2, 1) * color
+        high = color + (255 - color) * np.maximum(t * 2 - 1, 0)
+        ramp = np.where(t <= 0.5, low, high).astype(np.uint8)
+        self.buffer.set_palette([tuple(self.visualizer.fuchsia)] + [tuple(rgb) for rgb in ramp.tolist()])
+
+    def is_settled(self):
+        # silence only writes transparent columns, so once they fill the history the image never changes
+        return self.silent_columns >= self.columns
+
+    def update(self, audio_features):
+        amps = audio_features["amps"]
+        if len(amps) != self.n_bins:
+            self.map_rows(len(amps))
+
+        # dB of each row's bin, mapped onto palette indices 1..255, with 0 for anything below the floor
+        levels = self.levels
+        np.take(amps, self.row_bins, out=levels)
+        levels *= self.sensitivity / 50
+        np.maximum(levels, 1e-6, out=levels)
+        np.log10(levels, out=levels)
+        levels *= 20
+        levels -= self.FLOOR_DB
+        levels *= 255 / self.RANGE_DB
+        np.clip(levels, 0, 255, out=levels)
+        self.column[...] = levels
+
+        x = self.head * self.column_w
+        pixels = pygame.surfarray.pixels2d(self.buffer)
+        pixels[x:x + self.column_w] = self.column
+        del pixels  # unlocks the buffer for blitting
+        self.head = (self.head + 1) % self.columns
+        self.silent_columns = self.silent_columns + 1 if not self.column.any() else 0
+
+    def draw(self):
+        color = tuple(self.visualizer.color)
+        if color != self.palette_color:
+            self.update_palette(color)
+        # oldest columns from the head onwards on the left, newest up to the head on the right
+        screen = self.visualizer.screen
+        x, y = self.position
+        split = self.head * self.column_w
+        screen.blit(self.buffer, (x, y), (split, 0, self.buffer_w - split, self.buffer_h))
+        if split:
+            screen.blit(self.buffer, (x + self.buffer_w - split, y), (0, 0, split, self.buffer_h))
@@ -1,18 +1,36 @@
 import pygame
 import numpy as np
 
+from visualizers.trails import TrailBuffer
+
 # spin in a circle constantly, tracing with
 # radius = amplitude
 
 class Spirograph:
+    """
+    A dot circling the centre, with the speed and radius taken from two fft
+    bins. The dot is drawn into a TrailBuffer instead of the frame, so the
+    curve it traces stays on screen and fades out behind it.
+    """
     def __init__(self, visualizer):
         self.visualizer = visualizer
-        self.color = self.visualizer.color
-        self.center = (self.visualizer.SCREEN_WIDTH // 2, self.visualizer.SCREEN_HEIGHT // 2)
         self.angle = 0
         self.speed = 0
         self.radius = 0
         self.theta = 0
+        self.trail = None
+        self.last_position = None
+        self.still_frames = 0
+        self.update_settings()
+
+    def update_settings(self):
+        self.center = (self.visualizer.SCREEN_WIDTH // 2, self.visualizer.SCREEN_HEIGHT // 2)
+        decay = self.visualizer.settings["spirograph"]["trail"]
+        if self.trail is None:
+            self.trail = TrailBuffer(self.visualizer, decay)
+        else:
+            self.trail.set_decay(decay)
+            self.trail.resize((self.visualizer.SCREEN_WIDTH, self.visualizer.SCREEN_HEIGHT))
 
     def update(self, audio_features):
         fft = audio_features["fft"]
@@ -23,8 +41,17 @@ class Spirograph:
         self.theta += self.speed / 100
         self.angle += np.deg2rad(self.theta)
 
+    def is_settled(self):
+        # a dot that stays put redraws the same pixels, so the frame stops changing once the rest of the trail is gone
+        return self.still_frames >= self.trail.fade_frames
+
     def draw(self):
-        # Draw spirograph on screen
+        # Draw spirograph into the trail, which fades what earlier frames drew
         x = int(self.center[0] + self.radius * np.cos(self.angle))
         y = int(self.center[1] + self.radius * np.sin(self.angle))
-        pygame.draw.circle(self.visualizer.screen, self.visualizer.color, (x, y), 5)
\ No newline at end of file
+        self.still_frames = self.still_frames + 1 if (x, y) == self.last_position else 0
+        self.last_position = (x, y)
+        self.trail.fade()
+        pygame.draw.circle(self.trail.surface, self.visualizer.color, (x, y), 5)
+        self.trail.mark_drawn()
+        self.trail.blit()
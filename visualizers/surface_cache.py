@@ -0,0 +1,42 @@
+import pygame
+
+class SurfaceCache:
+    """
+    Prerendered static artwork for a visualizer. A layer is only re-rendered
+    when its key changes (e.g. the colour or a setting it depends on), and
+    its surface is reused across re-renders, so steady frames allocate nothing.
+    Pixels left in the host's colour key are transparent when blitted.
+    """
+    def __init__(self, visualizer):
+        self.visualizer = visualizer
+        self.layers = {}  # name -> (key, surface)
+
+    def layer(self, name, size, key, render):
+        """The cached surface for `name`, re-rendered with render(surface) when `key` or `size` changed."""
+        cached = self.layers.get(name)
+        if cached is not None and cached[0] == key and cached[1].get_size() == size:
+            return cached[1]
+        if cached is not None and cached[1].get_size() == size:
+            surface = cached[1]
+        else:
+            # same pixel format as the render target, so blits are plain copies
+            surface = pygame.Surface(size, 0, self.visualizer.screen)
+            surface.set_colorkey(self.visualizer.fuchsia)
+        surface.fill(self.visualizer.fuchsia)
+        render(surface)
+        self.layers[name] = (key, surface)
+        return surface
+
+    def blit(self, name, position, size, key, render):
+        self.visualizer.screen.blit(self.layer(name, size, key, render), position)
+
+    def clear(self):
+        self.layers.clear()
+
+
+def pixel_view(surface):
+    """A writable array view of the surface's pixels, indexed [x, y]. The surface stays locked while it lives."""
+    # pixels2d can't address 24-bit surfaces, pixels3d views them as (w, h, 3)
+    if surface.get_bytesize() == 3:
+        return pygame.surfarray.pixels3d(surface)
+    return pygame.surfarray.pixels2d(surface)
@@ -0,0 +1,84 @@
+import pygame
+
+def frames_to_clear(multiplier, floor):
+    """How many fades take a full-intensity channel to 0, following BLEND_MULT's (d * s + 255) >> 8 rounding."""
+    level, frames = 255, 0
+    while level:
+        level = max(((level * multiplier + 255) >> 8) - floor, 0)
+        frames += 1
+    return frames
+
+
+class TrailBuffer:
+    """
+    Persistent afterglow for a visualizer. It draws into `surface` and never
+    clears it. fade() dims every pixel once per frame by blitting a
+    prefilled surface with BLEND_RGB_MULT, so a trail of any length costs
+    the same as a single frame. Blits take SDL's fast blend loops, while a
+    blended fill() on a full HD surface is about 20 times slower. The
+    surface is blitted over the frame with black as its colour key, so
+    pixels that have fully faded are transparent.
+
+    BLEND_MULT rounds up, so a multiply alone leaves dim pixels at 1
+    forever. Each fade also subtracts FLOOR, so everything reaches black
+    in a known number of frames. Black itself is transparent, so draw in
+    anything brighter.
+    """
+    BLACK = (0, 0, 0)
+    FLOOR = 2
+
+    def __init__(self, visualizer, decay):
+        self.visualizer = visualizer
+        self.surface = None
+        self.multiply_surface = self.subtract_surface = None
+        self.fade_frames = self.frames_since_drawn = 0
+        self.set_decay(decay)
+        self.resize((visualizer.SCREEN_WIDTH, visualizer.SCREEN_HEIGHT))
+
+    def resize(self, size):
+        # same pixel format as the render target, so fades and blits stay plain per-pixel loops
+        if self.surface is None or self.surface.get_size() != size:
+            self.surface = pygame.Surface(size, 0, self.visualizer.screen)
+            self.surface.set_colorkey(self.BLACK)
+            self.multiply_surface = pygame.Surface(size, 0, self.surface)
+            self.subtract_surface = pygame.Surface(size, 0, self.surface)
+            self.fill_fade_surfaces()
+        self.clear()
+
+    def fill_fade_surfaces(self):
+        if self.multiply_surface is not None:
+            self.multiply_surface.fill(self.multiply)
+            self.subtract_surface.fill(self.subtract)
+
+    def set_decay(self, decay):
+        """`decay` is the fraction of brightness that is left after each frame."""
+        was_clear = self.is_clear()
+        multiplier = min(255, round(decay * 256))
+        self.multiply = (multiplier, multiplier, multiplier)
+        self.subtract = (self.FLOOR, self.FLOOR, self.FLOOR)
+        self.fade_frames = frames_to_clear(multiplier, self.FLOOR)
+        self.frames_since_drawn = self.fade_frames if was_clear else 0
+        self.fill_fade_surfaces()
+
+    def clear(self):
+        self.surface.fill(self.BLACK)
+        self.frames_since_drawn = self.fade_frames
+
+    def mark_drawn(self):
+        """Call after drawing into the surface, so is_clear() knows the trail has to fade out again."""
+        self.frames_since_drawn = 0
+
+    def is_clear(self):
+        return self.frames_since_drawn >= self.fade_frames
+
+    def fade(self):
+        if self.is_clear():
+            return  # already black, nothing to dim
+        # RGB-only blends leave any alpha channel of the render target alone
+        self.surface.blit(self.multiply_surface, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
+        self.surface.blit(self.subtract_surface, (0, 0), special_flags=pygame.BLEND_RGB_SUB)
+        self.frames_since_drawn += 1
+
+    def blit(self, position=(0, 0)):
+        if not self.is_clear():
+            self.visualizer.screen.blit(self.surface, position)